@@ -5,6 +5,8 @@ import pandas as pd
 from copy import copy
 import argparse
 
+from parent_matcher import LastNameIndex, ParentNameIndex, backup_parent_index
+
 # ======================
 # RAW DATA CLEANING AUTOMATION
 # ======================
@@ -172,36 +174,28 @@ def find_kids_of_parrents(parents_df, kids_df, backup_kids_df):
     valid_parents = kids_parents[kids_parents['parent_name'].notna()]
     other_distinct_parents = valid_parents['parent_name'].unique()
     
+    last_name_index = LastNameIndex(other_distinct_parents, distinct_parents)
+    parent_name_index = ParentNameIndex(distinct_parents, long_only=True)
+    backup_parents = backup_parent_index(backup_kids_df).to_dict()
+    
     # Fill missing parents
     for idx, row in empty_parents.iterrows():
         kid_name = row['kid_name']
-        matched_parent = None
         
         # Try matching by last name
-        for parent in [*other_distinct_parents, *distinct_parents]:
-            if not isinstance(parent, str) or not parent.strip():
-                continue
-            parent_last = parent.split()[-1].lower()
-            kid_first = kid_name.split()[0].lower() if kid_name and kid_name.split() else ""
-            if parent_last == kid_first:
-                matched_parent = parent
-                break
+        matched_parent = last_name_index.match_kid(kid_name)
         
         # Fallback to backup data
-        if not matched_parent and row['kid_id'] in backup_kids_df['kid_id'].values:
-            backup_row = backup_kids_df[backup_kids_df['kid_id'] == row['kid_id']].iloc[0]
-            matched_parent = backup_row['parent_name']
+        if not matched_parent and row['kid_id'] in backup_parents:
+            matched_parent = backup_parents[row['kid_id']]
         
         empty_parents.at[idx, 'parent_name'] = matched_parent if matched_parent else row['parent_name']
     
     # Standardize parent names
     for idx, row in valid_parents.iterrows():
-        current_name = str(row['parent_name'])
-        for parent in distinct_parents:
-            parent_str = str(parent)
-            if (parent_str in current_name or current_name in parent_str) and len(parent_str) > 3:
-                valid_parents.at[idx, 'parent_name'] = parent
-                break
+        matched_parent = parent_name_index.match(row['parent_name'])
+        if matched_parent is not None:
+            valid_parents.at[idx, 'parent_name'] = matched_parent
     
     # Combine and sort
     combined = pd.concat([valid_parents, empty_parents], ignore_index=True)
@@ -0,0 +1,115 @@
+import numpy as np
+import pandas as pd
+
+# Status codes, in the order the rules are checked
+NOT_REGISTERED, NOTHING_PAID, FULLY_PAID, G_REDUCED_FEE, A5_SHORT, B0_SHORT, PARTIAL = range(7)
+
+STATUS_TEXTS = [
+    "Not yet registered",
+    "Nothing paid.",
+    "Fully paid.",
+    "G1 and G2 paid €15 instead of €25.",
+    "Transfers only €10, €15, or €20 instead of €25.",
+    "Transfers only €10 instead of €15.",
+    None,  # partial payments are formatted from the amounts, see format_status
+]
+
+STATUS_COLORS = [
+    "FF595959",
+    "FFFF0000",
+    "FF92D050",
+    "FFFFFF00",
+    "FFC65911",
+    "FFC65911",
+    "FFFFC000",
+]
+
+
+def classify_payment_statuses(months_paid, monthly_fee, allocated_amount, class_names):
+    """
+    Status code and colour for every kid at once.
+
+    Same rules as determine_status_and_color, evaluated with np.select over
+    whole arrays. Returns (status_codes, colors); texts are only built when
+    needed, with format_status.
+    """
+    months_paid = np.asarray(months_paid, dtype=float)
+    monthly_fee = np.asarray(monthly_fee, dtype=float)
+    allocated_amount = np.asarray(allocated_amount, dtype=float)
+    classes = np.array([c.strip() if isinstance(c, str) else c for c in class_names], dtype=object)
+    is_a5 = classes == 'A5'
+    is_b0 = classes == 'B0'
+
+    conditions = [
+        monthly_fee <= 0,
+        allocated_amount == 0,
+        months_paid >= 1.0,
+        is_a5 & (np.abs(allocated_amount - 15) < 0.01),
+        is_a5 & np.isin(allocated_amount, [10, 15, 20]),
+        is_b0 & (allocated_amount == 10),
+    ]
+    choices = [NOT_REGISTERED, NOTHING_PAID, FULLY_PAID, G_REDUCED_FEE, A5_SHORT, B0_SHORT]
+    status_codes = np.select(conditions, choices, default=PARTIAL).astype(np.int8)
+    colors = np.array(STATUS_COLORS, dtype=object)[status_codes]
+    return status_codes, colors
+
+
+def format_status(status_code, allocated_amount, months_paid):
+    """Status text for one kid."""
+    if status_code == PARTIAL:
+        return f"Partial payment: {allocated_amount:.2f}€ ({months_paid:.2f} months)"
+    return STATUS_TEXTS[status_code]
+
+
+def allocate_family_payments(kids, family_payments):
+    """
+    Split every family's payment over its kids at once.
+
+    kids: DataFrame, one row per kid, with 'family' and 'monthly_fee' columns
+        and an optional 'prior_allocation' column. Within a family the first
+        row receives the remainder.
+    family_payments: mapping or Series, family -> new payment amount.
+
+    Each family's effective amount (new payment + prior allocations) buys
+    whole months for all its kids; the rest goes to the first kid. Returns a
+    copy of `kids` with unrounded total_fee, allocated_amount, months_paid and
+    extras columns.
+    """
+    result = kids.copy()
+    codes, families = pd.factorize(result['family'], sort=False)
+    n_families = len(families)
+
+    fees = result['monthly_fee'].to_numpy(dtype=float)
+    if 'prior_allocation' in result:
+        prior = result['prior_allocation'].to_numpy(dtype=float)
+    else:
+        prior = np.zeros(len(result))
+
+    payments = pd.Series(family_payments, dtype=float).reindex(families).fillna(0.0).to_numpy()
+    total_fee = np.bincount(codes, weights=fees, minlength=n_families)
+    effective = payments + np.bincount(codes, weights=prior, minlength=n_families)
+
+    # floor_divide follows Python's float // semantics
+    registered = total_fee > 0
+    full_months = np.zeros(n_families)
+    np.floor_divide(effective, total_fee, out=full_months, where=registered)
+    remainder = effective - full_months * total_fee
+
+    is_first = ~pd.Series(codes).duplicated().to_numpy()
+    base = full_months[codes] * fees
+    allocated = np.where(is_first, base + remainder[codes], base)
+
+    has_fee = fees > 0
+    months_paid = np.zeros(len(result))
+    np.divide(allocated, fees, out=months_paid, where=has_fee)
+    full_months_for_kid = np.zeros(len(result))
+    np.floor_divide(allocated, fees, out=full_months_for_kid, where=has_fee)
+    extras = np.where(has_fee, allocated - full_months_for_kid * fees, 0.0)
+
+    family_registered = registered[codes]
+    result['total_fee'] = total_fee[codes]
+    result['allocated_amount'] = np.where(family_registered, allocated, 0.0)
+    result['months_paid'] = np.where(family_registered, months_paid, 0.0)
+    result['extras'] = np.where(family_registered, extras, 0.0)
+    result['monthly_fee'] = np.where(family_registered, fees, 0.0)
+    return result
@@ -0,0 +1,137 @@
+import math
+import re
+
+import numpy as np
+import pandas as pd
+
+# Euro sign, also as it appears in files saved with the wrong encoding
+CURRENCY = r"(?:€|EURO|EUR|â‚¬|\ufffd+)"
+
+# Optional sign and currency on either side of the number; "20,00-" is how
+# some bank exports write debits
+AMOUNT_PATTERN = re.compile(
+    rf"^(?P<lead>[-+])?\s*{CURRENCY}?\s*(?P<sign>[-+])?\s*"
+    r"(?P<number>\d[\d.,' ]*)"
+    rf"\s*{CURRENCY}?\s*(?P<trail>-)?$",
+    re.IGNORECASE,
+)
+
+# A separator that only groups digits in threes is a thousands separator
+GROUPED = {
+    ",": re.compile(r"\d{1,3}(?:,\d{3})+"),
+    ".": re.compile(r"\d{1,3}(?:\.\d{3})+"),
+}
+
+
+def parse_amount(value, decimal=","):
+    """
+    Parse one money amount; NaN if blank, None if it cannot be read.
+
+    Handles "1.234,56", "25,00 €", "€20", "-15", "20,00-" and plain numbers.
+    `decimal` is the locale's decimal separator; it decides ambiguous values
+    such as "1,234", while "1.234,56" / "1,234.56" are read either way.
+    """
+    if isinstance(value, (bool, np.bool_)):
+        return None
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return float(value)
+    if value is None:
+        return math.nan
+
+    text = str(value).strip().replace("−", "-")
+    if not text or text.lower() in ("nan", "none"):
+        return math.nan
+    match = AMOUNT_PATTERN.match(text)
+    if match is None:
+        return None
+
+    number = re.sub(r"['\s]", "", match.group("number"))
+    if "," in number and "." in number:
+        decimal_sep = "," if number.rfind(",") > number.rfind(".") else "."
+    elif "," in number or "." in number:
+        sep = "," if "," in number else "."
+        # The locale's own separator only groups thousands when it appears more than once
+        grouped = GROUPED[sep].fullmatch(number) and (sep != decimal or number.count(sep) > 1)
+        decimal_sep = None if grouped else sep
+    else:
+        decimal_sep = None
+
+    for sep in ",.":
+        if sep != decimal_sep:
+            number = number.replace(sep, "")
+    if decimal_sep is not None:
+        if number.count(decimal_sep) > 1:
+            return None
+        number = number.replace(decimal_sep, ".")
+
+    amount = float(number)
+    if "-" in (match.group("lead"), match.group("sign"), match.group("trail")):
+        amount = -amount
+    return amount
+
+
+def parse_amounts(values, decimal=","):
+    """
+    Parse a whole column of money amounts, same results as parse_amount per cell.
+
+    Text cells go through pandas string operations: strip, match
+    AMOUNT_PATTERN, pick the decimal separator per cell, drop the thousands
+    separators and apply the sign. Numeric cells are taken as they are.
+
+    Returns (amounts, invalid): float Series aligned with `values`, NaN for
+    blank or unreadable cells, and a boolean Series flagging the non-blank
+    cells that could not be read.
+    """
+    series = pd.Series(values)
+    if pd.api.types.is_numeric_dtype(series.dtype) and not pd.api.types.is_bool_dtype(series.dtype):
+        return series.astype(float), pd.Series(False, index=series.index)
+
+    amounts = pd.Series(np.nan, index=series.index)
+    invalid = pd.Series(False, index=series.index)
+    if pd.api.types.is_bool_dtype(series.dtype):
+        invalid[:] = series.notna()
+        return amounts, invalid
+
+    cell_types = series.astype(object).map(type)
+    is_text = cell_types.isin([str, np.str_])
+
+    # Numbers and missing cells are taken as they are, bools cannot be read
+    others = series[~is_text].astype(object)
+    is_bool = cell_types[~is_text].isin([bool, np.bool_])
+    invalid[others.index[is_bool]] = True
+    amounts[others.index] = pd.to_numeric(others.where(~is_bool), errors="coerce").astype(float)
+
+    text = series[is_text].astype(str).str.strip().str.replace("−", "-", regex=False)
+    blank = text.eq("") | text.str.lower().isin(["nan", "none"])
+    matched = text.str.fullmatch(AMOUNT_PATTERN.pattern, flags=re.IGNORECASE) & ~blank
+    invalid[text.index[~matched & ~blank]] = True
+
+    # In a matching cell digits and separators only occur in the number, "-" only as its sign
+    text = text[matched]
+    number = text.str.replace(r"[^\d.,]", "", regex=True)
+    commas = number.str.count(",")
+    dots = number.str.count(r"\.")
+    # The locale's own separator only groups thousands when it appears more than once
+    grouped_comma = number.str.fullmatch(GROUPED[","].pattern) & (("," != decimal) | (commas > 1))
+    grouped_dot = number.str.fullmatch(GROUPED["."].pattern) & (("." != decimal) | (dots > 1))
+    decimal_sep = pd.Series(np.select(
+        [(commas > 0) & (dots > 0), commas > 0, dots > 0],
+        [
+            np.where(number.str.contains(r",[^.]*$", regex=True), ",", "."),
+            np.where(grouped_comma, "", ","),
+            np.where(grouped_dot, "", "."),
+        ],
+        default="",
+    ), index=number.index)
+
+    no_decimal = number.str.replace(r"[.,]", "", regex=True)
+    dot_decimal = number.str.replace(",", "", regex=False)
+    comma_decimal = number.str.replace(".", "", regex=False).str.replace(",", ".", regex=False)
+    digits = no_decimal.where(decimal_sep == "", dot_decimal.where(decimal_sep == ".", comma_decimal))
+    repeated = ((decimal_sep == ",") & (commas > 1)) | ((decimal_sep == ".") & (dots > 1))
+
+    negative = text.str.contains("-", regex=False)
+    parsed = pd.to_numeric(digits.where(~repeated), errors="coerce").astype(float)
+    amounts[number.index] = parsed.where(~negative, -parsed)
+    invalid[number.index[repeated]] = True
+    return amounts, invalid
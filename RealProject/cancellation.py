@@ -0,0 +1,49 @@
+import threading
+
+# Rows processed between two cancellation checks in a loop
+CHECK_EVERY = 64
+
+
+class Cancelled(Exception):
+    """Raised at a checkpoint once the run has been cancelled."""
+
+
+class CancellationToken:
+    """
+    Cooperative stop request shared between the GUI and a processing thread.
+
+    The GUI calls cancel(); the pipeline checks the token between stages and
+    inside its row loops and unwinds with Cancelled, so a run never stops
+    halfway through writing a file.
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+
+    def cancel(self):
+        self.event.set()
+
+    @property
+    def cancelled(self):
+        return self.event.is_set()
+
+    def check(self):
+        if self.event.is_set():
+            raise Cancelled("Processing cancelled")
+
+
+def checkpoint(cancel):
+    """cancel.check() for an optional token."""
+    if cancel is not None:
+        cancel.check()
+
+
+def checked(items, cancel, every=CHECK_EVERY):
+    """Iterate over items, checking an optional token every `every` items."""
+    if cancel is None:
+        yield from items
+        return
+    for i, item in enumerate(items):
+        if i % every == 0:
+            cancel.check()
+        yield item
@@ -0,0 +1,169 @@
+import os
+import secrets
+import stat
+from contextlib import contextmanager
+from copy import copy
+
+import pandas as pd
+from openpyxl.cell.cell import MergedCell
+from openpyxl.styles import PatternFill
+from openpyxl.styles.cell_style import StyleArray
+
+# Style record fields copied from a reference cell by copy_cell_format
+FORMAT_FIELDS = ("fontId", "borderId", "numFmtId", "protectionId", "alignmentId")
+
+
+class StatusStyleCache:
+    """
+    Pre-built style records for status-coloured month cells.
+
+    Each colour's PatternFill is registered in the workbook once, and each
+    (existing style, colour) combination is resolved to a style record once;
+    cells then get a copy of that record. The result is the same as
+    `copy_cell_format(reference_cell, cell)` followed by `cell.fill = PatternFill(...)`,
+    without creating and hashing new style objects for every cell.
+    """
+
+    def __init__(self, workbook, reference_cell=None):
+        self.workbook = workbook
+        self.reference = reference_cell._style if reference_cell is not None and reference_cell.has_style else None
+        self.fill_ids = {}
+        self.styles = {}
+
+    def fill_id(self, color):
+        """Index of the solid fill for a colour in the workbook's fill list."""
+        fill_id = self.fill_ids.get(color)
+        if fill_id is None:
+            fill = PatternFill(start_color=color, end_color=color, fill_type="solid")
+            fill_id = self.fill_ids[color] = self.workbook._fills.add(fill)
+        return fill_id
+
+    def apply(self, cell, color, copy_format=True):
+        """Fill a cell with a solid colour, copying the reference cell's format first if asked."""
+        current = cell._style if cell._style is not None else StyleArray()
+        key = (tuple(current), color, copy_format)
+        style = self.styles.get(key)
+        if style is None:
+            style = copy(current)
+            if copy_format and self.reference is not None:
+                for field in FORMAT_FIELDS:
+                    setattr(style, field, getattr(self.reference, field))
+            style.fillId = self.fill_id(color)
+            self.styles[key] = style
+        cell._style = copy(style)
+
+
+class ColumnLayout:
+    """
+    Final column positions of the kids sheet, planned before anything is moved.
+
+    Month columns start at `month_start_col`. When the sheet has fewer month
+    columns than `target_months`, every column after the last month (class,
+    book, notes...) moves right by the missing count. A phone column is
+    appended after them when the extended sheet is narrower than
+    `phone_min_column`.
+    """
+
+    def __init__(self, max_column, month_start_col, month_count, target_months, already_extended=False, phone_min_column=32):
+        self.month_start_col = month_start_col
+        self.month_end_col = month_start_col + month_count - 1
+        self.already_extended = already_extended
+        self.months_to_add = 0 if already_extended else max(len(target_months) - month_count, 0)
+        self.shift_from = self.month_end_col + 1
+        self.max_column = max_column + self.months_to_add
+        if self.months_to_add > 0:
+            # New month headers are written even when nothing sits right of the months
+            self.max_column = max(self.max_column, month_start_col + len(target_months) - 1)
+        self.add_phone = self.max_column < phone_min_column
+        self.phone_column = self.max_column + 1
+
+    def target(self, column):
+        """Column a cell currently in `column` ends up in."""
+        return column + self.months_to_add if column >= self.shift_from else column
+
+
+def plan_column_layout(max_column, month_headers, month_start_col, months, target_months):
+    """
+    ColumnLayout for a kids sheet, detecting sheets that already hold every target month.
+
+    month_headers: values of the month number row (row 3), first column first.
+    """
+    last_expected_col = month_start_col + len(target_months) - 1
+    already_extended = False
+    if max_column >= last_expected_col and len(month_headers) >= last_expected_col:
+        last_month_header = month_headers[last_expected_col - 1]
+        already_extended = (
+            not pd.isna(last_month_header) and bool(last_month_header)
+            and str(last_month_header).strip() in ['8', '8_next']
+        )
+    return ColumnLayout(max_column, month_start_col, len(months), target_months, already_extended)
+
+
+def apply_column_layout(ws, layout):
+    """
+    Move cells to their planned columns in a single pass over the sheet.
+
+    Same cell moves as calling `ws.insert_cols(layout.shift_from)` once per
+    added month, but every cell is touched once. Merged ranges right of the
+    insertion point move with their cells, ranges spanning it are widened.
+    """
+    offset = layout.months_to_add
+    if offset <= 0:
+        return
+
+    cells = {}
+    for (row, column), cell in ws._cells.items():
+        if column >= layout.shift_from:
+            column += offset
+            cell.column = column
+        cells[row, column] = cell
+    ws._cells = cells
+
+    for merged in ws.merged_cells.ranges:
+        if merged.min_col >= layout.shift_from:
+            merged.shift(col_shift=offset)
+        elif merged.max_col >= layout.shift_from:
+            merged.expand(right=offset)
+            for row in range(merged.min_row, merged.max_row + 1):
+                for column in range(layout.shift_from, layout.shift_from + offset):
+                    ws._cells[row, column] = MergedCell(ws, row=row, column=column)
+
+
+def _create_file(directory, prefix, suffix):
+    """
+    Create a new empty file with a unique name in directory.
+
+    Unlike tempfile.mkstemp (always private, 0o600) the file is opened with
+    mode 0o666, so the system applies the process umask as for any new file.
+    """
+    while True:
+        path = os.path.join(directory, f"{prefix}{secrets.token_hex(4)}{suffix}")
+        try:
+            os.close(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666))
+            return path
+        except FileExistsError:
+            continue
+
+
+@contextmanager
+def replace_on_success(output_file):
+    """
+    Path of a temporary file next to output_file, moved over it when the block succeeds.
+
+    A run that fails or is cancelled while writing removes the temporary file
+    and leaves any existing output untouched. Every call gets its own file,
+    so runs writing the same output never share one. The output keeps the
+    mode of the file it replaces; a new one gets the usual mode for new files.
+    """
+    directory, name = os.path.split(os.path.abspath(output_file))
+    stem, ext = os.path.splitext(name)
+    temp_file = _create_file(directory, f"~{stem}.", ext)
+    try:
+        yield temp_file
+        if os.path.exists(output_file):
+            os.chmod(temp_file, stat.S_IMODE(os.stat(output_file).st_mode))
+        os.replace(temp_file, output_file)
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
@@ -0,0 +1,150 @@
+from collections import OrderedDict
+
+import numpy as np
+from openpyxl.styles import Color
+
+from cancellation import checked
+
+RED = "FFFF0000"
+NOT_REGISTERED = "FF595959"
+EMPTY_COLORS = ["00000000", "None", ""]
+COLOR_CACHE_SIZE = 256
+
+
+def decode_fill_color(fill):
+    """Decode a cell fill to the colour string used for payment statuses."""
+    color = None
+    try:
+        fill_color = fill.start_color
+        if isinstance(fill_color, Color):
+            if fill_color.rgb and isinstance(fill_color.rgb, str):
+                color = fill_color.rgb
+            elif fill_color.indexed is not None:
+                color = str(fill_color.indexed)
+            elif fill_color.theme is not None:
+                color = f"theme:{fill_color.theme}"
+    except Exception:
+        color = NOT_REGISTERED
+
+    if color and "Values must be of type <class 'int'>" in color:
+        color = NOT_REGISTERED
+    return color
+
+
+class FillColorCache:
+    """
+    Bounded LRU of decoded fill colours, keyed by the cell's style fill id.
+
+    Cells of a sheet share a handful of style records, so decoding the
+    openpyxl Color (rgb / indexed / theme) once per fill id instead of once
+    per cell makes colour reads cost O(distinct styles). Fill ids are only
+    meaningful within one workbook, so use one cache per workbook.
+    """
+
+    def __init__(self, workbook, to_text=None, maxsize=COLOR_CACHE_SIZE):
+        self.fills = workbook._fills
+        self.to_text = to_text
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, cell):
+        """Return (color, status_text) for a cell; status_text is None without `to_text`."""
+        # Cells created without a style have no style record and use fill 0; cells of
+        # read-only sheets carry their record as style_array, empty ones have none
+        style = cell._style if hasattr(cell, "_style") else getattr(cell, "style_array", None)
+        fill_id = style.fillId if style is not None else 0
+        entry = self.entries.get(fill_id)
+        if entry is not None:
+            self.hits += 1
+            self.entries.move_to_end(fill_id)
+            return entry
+
+        self.misses += 1
+        color = decode_fill_color(self.fills[fill_id])
+        text = self.to_text(color) if self.to_text else None
+        entry = self.entries[fill_id] = (color, text)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+        return entry
+
+    def color(self, cell):
+        return self.lookup(cell)[0]
+
+    def status_text(self, cell):
+        return self.lookup(cell)[1]
+
+
+class FillMatrix:
+    """
+    Colour codes and has-value flags for a rectangular block of a sheet.
+
+    `codes[i, j]` indexes into `palette` (decoded colour strings) for the cell
+    at (min_row + i, min_col + j); `has_value[i, j]` is True when that cell
+    holds non-blank text, and `texts[i, j]` is that stripped text (or None).
+    """
+
+    def __init__(self, codes, palette, has_value, min_row, min_col, texts=None):
+        self.codes = codes
+        self.palette = palette
+        self.has_value = has_value
+        self.min_row = min_row
+        self.min_col = min_col
+        self.texts = texts
+
+    def color_at(self, i, j):
+        return self.palette[self.codes[i, j]]
+
+    def text_at(self, i, j):
+        return self.texts[i, j]
+
+    def last_update_columns(self):
+        """
+        Index of the last non-red cell with a value or a colour, per row.
+
+        Rows without any such cell get -1.
+        """
+        colored = np.array([bool(c) and c not in EMPTY_COLORS for c in self.palette], dtype=bool)
+        red = np.array([c == RED for c in self.palette], dtype=bool)
+        hit = (self.has_value | colored[self.codes]) & ~red[self.codes]
+
+        n_cols = hit.shape[1]
+        reversed_hit = hit[:, ::-1]
+        last = n_cols - 1 - reversed_hit.argmax(axis=1)
+        last[~reversed_hit.any(axis=1)] = -1
+        return last
+
+
+def extract_fill_matrix(sheet, min_row, max_row, min_col, max_col, colors=None, cancel=None):
+    """
+    Build a FillMatrix for a block of cells in a single pass over the sheet.
+
+    cancel: optional CancellationToken, checked every few rows.
+    """
+    if colors is None:
+        colors = FillColorCache(sheet.parent)
+    shape = (max_row - min_row + 1, max_col - min_col + 1)
+    codes = np.zeros(shape, dtype=np.int32)
+    has_value = np.zeros(shape, dtype=bool)
+    texts = np.full(shape, None, dtype=object)
+    palette = []
+    palette_index = {}
+
+    rows = sheet.iter_rows(min_row=min_row, max_row=max_row, min_col=min_col, max_col=max_col)
+    for i, row in enumerate(checked(rows, cancel)):
+        for j, cell in enumerate(row):
+            value = cell.value
+            text = str(value).strip() if value else ""
+            if text:
+                has_value[i, j] = True
+                texts[i, j] = text
+
+            color = colors.color(cell)
+            code = palette_index.get(color)
+            if code is None:
+                code = palette_index[color] = len(palette)
+                palette.append(color)
+            codes[i, j] = code
+
+    return FillMatrix(codes, palette, has_value, min_row, min_col, texts=texts)
@@ -0,0 +1,323 @@
+import hashlib
+import json
+import os
+import shutil
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+except ImportError:  # the cache is optional, inputs are then parsed every run
+    pa = None
+
+from fill_matrix import FillMatrix
+
+CACHE_DIR = ".payment_cache"
+CACHE_MAX_BYTES = 200 * 1024 * 1024
+CACHE_VERSION = 1
+
+# Cell type tags for object columns, which read_excel fills with mixed values
+NONE_TAG, STR_TAG, INT_TAG, FLOAT_TAG, DATETIME_TAG, TIMESTAMP_TAG, BOOL_TAG = range(7)
+
+
+def file_key(file_path, data=None):
+    """Cache key of an input file: content hash, size and modification time."""
+    if data is None:
+        with open(file_path, "rb") as f:
+            data = f.read()
+    stat = os.stat(file_path)
+    digest = hashlib.sha256(data).hexdigest()[:40]
+    return f"v{CACHE_VERSION}-{digest}-{stat.st_size}-{stat.st_mtime_ns}"
+
+
+def frame_digest(df):
+    """
+    Content hash of a DataFrame: column labels, dtypes, index and values.
+
+    Object columns also hash the type of every value, so 1 and "1" differ.
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps([[str(label), str(dtype)] for label, dtype in df.dtypes.items()]).encode("utf-8"))
+    digest.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    for label, dtype in df.dtypes.items():
+        if dtype == object:
+            types = df[label].map(lambda value: type(value).__name__)
+            digest.update(pd.util.hash_pandas_object(types, index=False).to_numpy().tobytes())
+    return digest.hexdigest()[:40]
+
+
+def stage_key(stage, *parts):
+    """Cache key of a pipeline stage result, from its name and the digests / config of its inputs."""
+    digest = hashlib.sha256("|".join((stage, *parts)).encode("utf-8")).hexdigest()[:40]
+    return f"v{CACHE_VERSION}-{stage}-{digest}"
+
+
+def _cell_tag(value):
+    if value is None:
+        return NONE_TAG
+    if isinstance(value, (bool, np.bool_)):
+        return BOOL_TAG
+    if isinstance(value, (int, np.integer)):
+        return INT_TAG
+    if isinstance(value, (float, np.floating)):
+        return FLOAT_TAG
+    if isinstance(value, str):
+        return STR_TAG
+    if isinstance(value, pd.Timestamp) and value.tzinfo is None:
+        return TIMESTAMP_TAG
+    if isinstance(value, datetime) and value.tzinfo is None:
+        return DATETIME_TAG
+    raise TypeError(f"Cannot cache cell value of type {type(value).__name__}")
+
+
+TAG_TYPES = {
+    STR_TAG: "string",
+    INT_TAG: "int64",
+    FLOAT_TAG: "float64",
+    DATETIME_TAG: "timestamp",
+    TIMESTAMP_TAG: "timestamp",
+    BOOL_TAG: "bool",
+}
+
+
+def _arrow_type(tag):
+    name = TAG_TYPES[tag]
+    return pa.timestamp("us") if name == "timestamp" else pa.type_for_alias(name)
+
+
+def frame_to_table(df):
+    """
+    Arrow table holding a DataFrame exactly as read_excel returned it.
+
+    Typed columns are stored as they are. Object columns are split into a tag
+    column and one nullable column per value type, so ints, floats, strings
+    and dates mixed in one column come back as the same Python objects.
+    """
+    if not isinstance(df.index, pd.RangeIndex) or df.index.start != 0 or df.index.step != 1:
+        raise TypeError("Only frames with a default RangeIndex can be cached")
+
+    arrays, names, columns = [], [], []
+    for pos, label in enumerate(df.columns):
+        series = df.iloc[:, pos]
+        if not isinstance(label, (str, int)):
+            raise TypeError(f"Cannot cache column label {label!r}")
+        column = {"label": label, "dtype": str(series.dtype)}
+
+        if series.dtype == object:
+            values = series.tolist()
+            tags = [_cell_tag(value) for value in values]
+            column["tags"] = sorted(set(tags) - {NONE_TAG})
+            arrays.append(pa.array(tags, type=pa.int8()))
+            names.append(f"{pos}:tag")
+            for tag in column["tags"]:
+                typed = [value if t == tag else None for value, t in zip(values, tags)]
+                arrays.append(pa.array(typed, type=_arrow_type(tag), from_pandas=False))
+                names.append(f"{pos}:{tag}")
+        else:
+            arrays.append(pa.array(series))
+            names.append(f"{pos}")
+        columns.append(column)
+
+    metadata = {"columns": json.dumps(columns), "rows": str(len(df))}
+    if not arrays:
+        return pa.table({}).replace_schema_metadata(metadata)
+    return pa.Table.from_arrays(arrays, names=names, metadata=metadata)
+
+
+def table_to_frame(table):
+    """Inverse of frame_to_table."""
+    metadata = table.schema.metadata
+    columns = json.loads(metadata[b"columns"])
+    rows = int(metadata[b"rows"])
+
+    data = {}
+    for pos, column in enumerate(columns):
+        if column["dtype"] == "object":
+            tags = table.column(f"{pos}:tag").to_pylist()
+            typed = {tag: table.column(f"{pos}:{tag}").to_pylist() for tag in column["tags"]}
+            values = np.empty(rows, dtype=object)
+            for i, tag in enumerate(tags):
+                if tag == TIMESTAMP_TAG:
+                    values[i] = pd.Timestamp(typed[tag][i])
+                elif tag != NONE_TAG:
+                    values[i] = typed[tag][i]
+            data[pos] = pd.Series(values, dtype=object)
+        else:
+            data[pos] = table.column(f"{pos}").to_pandas().astype(column["dtype"])
+
+    df = pd.DataFrame(data, index=pd.RangeIndex(rows))
+    df.columns = [column["label"] for column in columns]
+    return df
+
+
+def matrix_to_table(matrix):
+    """Arrow table holding a FillMatrix (codes, has-value flags, cell texts)."""
+    metadata = {
+        "shape": json.dumps(list(matrix.codes.shape)),
+        "palette": json.dumps(matrix.palette),
+        "origin": json.dumps([matrix.min_row, matrix.min_col]),
+    }
+    return pa.table({
+        "codes": matrix.codes.ravel(),
+        "has_value": matrix.has_value.ravel(),
+        "texts": pa.array(matrix.texts.ravel().tolist(), type=pa.string()),
+    }).replace_schema_metadata(metadata)
+
+
+def table_to_matrix(table):
+    """Inverse of matrix_to_table."""
+    metadata = table.schema.metadata
+    shape = tuple(json.loads(metadata[b"shape"]))
+    min_row, min_col = json.loads(metadata[b"origin"])
+    codes = table.column("codes").to_numpy().astype(np.int32).reshape(shape)
+    has_value = table.column("has_value").to_numpy(zero_copy_only=False).astype(bool).reshape(shape)
+    texts = np.array(table.column("texts").to_pylist(), dtype=object).reshape(shape)
+    return FillMatrix(codes, json.loads(metadata[b"palette"]), has_value, min_row, min_col, texts=texts)
+
+
+class InputCache:
+    """
+    On-disk cache of parsed input workbooks, one directory per input file version.
+
+    Entries are keyed by file_key (content hash, size, mtime) and hold Arrow IPC
+    files: DataFrames as read_excel produced them, fill matrices, and a small
+    JSON of sheet facts. Least recently used entries are evicted once the
+    cache grows past `max_bytes`. Without pyarrow the cache is disabled and
+    every lookup is a miss.
+
+    read_only: use the stored entries but never write, touch or evict any
+    (see reader), e.g. for dry runs.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES, read_only=False):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.read_only = read_only
+        self.enabled = pa is not None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _path(self, key, name):
+        return os.path.join(self.cache_dir, key, name)
+
+    def _read(self, key, name):
+        path = self._path(key, name)
+        if not self.enabled or not os.path.exists(path):
+            self.misses += 1
+            return None
+        try:
+            with pa.memory_map(path) as source:
+                table = ipc.open_file(source).read_all()
+        except (OSError, pa.ArrowException):
+            self.misses += 1
+            return None
+        self.hits += 1
+        if not self.read_only:
+            os.utime(os.path.join(self.cache_dir, key))
+        return table
+
+    def reader(self):
+        """Read-only cache on the same directory."""
+        return InputCache(self.cache_dir, self.max_bytes, read_only=True)
+
+    def _write(self, key, name, table):
+        entry = os.path.join(self.cache_dir, key)
+        os.makedirs(entry, exist_ok=True)
+        tmp_path = self._path(key, name + ".tmp")
+        with pa.OSFile(tmp_path, "wb") as sink:
+            with ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, self._path(key, name))
+        self.evict(keep=key)
+
+    def frame(self, key, name, build):
+        """Cached DataFrame, or build() it and store the result."""
+        table = self._read(key, name)
+        if table is not None:
+            return table_to_frame(table)
+        df = build()
+        if self.enabled and not self.read_only:
+            try:
+                self._write(key, name, frame_to_table(df))
+            except (TypeError, OSError, pa.ArrowException) as e:
+                print(f"⚠️ Could not cache {name}: {e}")
+        return df
+
+    def matrix(self, key, name, build):
+        """Cached FillMatrix, or build() it and store the result."""
+        table = self._read(key, name)
+        if table is not None:
+            return table_to_matrix(table)
+        matrix = build()
+        if self.enabled and not self.read_only:
+            try:
+                self._write(key, name, matrix_to_table(matrix))
+            except (OSError, pa.ArrowException) as e:
+                print(f"⚠️ Could not cache {name}: {e}")
+        return matrix
+
+    def stage_frame(self, stage, inputs, build):
+        """
+        DataFrame result of a pipeline stage, memoized on the content of its inputs.
+
+        inputs: DataFrames (hashed with frame_digest, so pass only the columns
+        the stage reads) and config values (compared by repr).
+        """
+        if not self.enabled:
+            return build()
+        parts = [frame_digest(value) if isinstance(value, pd.DataFrame) else repr(value) for value in inputs]
+        return self.frame(stage_key(stage, *parts), f"{stage}.arrow", build)
+
+    def read_excel(self, file_path, header=None):
+        """Cached `pd.read_excel(file_path, header=header)`."""
+        with open(file_path, "rb") as f:
+            data = f.read()
+        return self.frame(file_key(file_path, data), f"frame_h{header}.arrow", lambda: pd.read_excel(file_path, header=header))
+
+    def facts(self, key):
+        """Sheet facts stored for a key (e.g. max_column), or None."""
+        path = self._path(key, "facts.json")
+        if not self.enabled or not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def store_facts(self, key, facts):
+        if not self.enabled or self.read_only:
+            return
+        os.makedirs(os.path.join(self.cache_dir, key), exist_ok=True)
+        with open(self._path(key, "facts.json"), "w") as f:
+            json.dump(facts, f)
+
+    def evict(self, keep=None):
+        """Drop least recently used entries until the cache fits in max_bytes."""
+        if not os.path.isdir(self.cache_dir):
+            return
+        entries = []
+        total = 0
+        for key in os.listdir(self.cache_dir):
+            entry = os.path.join(self.cache_dir, key)
+            if not os.path.isdir(entry):
+                continue
+            size = sum(os.path.getsize(os.path.join(entry, name)) for name in os.listdir(entry))
+            entries.append((os.path.getmtime(entry), key, size))
+            total += size
+
+        for _, key, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(os.path.join(self.cache_dir, key), ignore_errors=True)
+            total -= size
+            self.evictions += 1
+
+    def report(self):
+        """One-line summary of cache activity."""
+        if not self.enabled:
+            return "📦 Input cache disabled (pyarrow not installed)."
+        return f"📦 Input cache: {self.hits} hits, {self.misses} misses, {self.evictions} evictions."
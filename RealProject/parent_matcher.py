@@ -0,0 +1,132 @@
+from collections import defaultdict
+
+GRAM = 3
+
+
+def trigrams(text):
+    """Set of all 3-character substrings of a string."""
+    return {text[i:i + GRAM] for i in range(len(text) - GRAM + 1)}
+
+
+class LastNameIndex:
+    """
+    Parent lookup by last name, built once per run.
+
+    Returns the same parent as scanning the lists in order and taking the
+    first one whose last word equals the kid's first word (case-insensitive).
+    """
+
+    def __init__(self, *parent_lists):
+        self.index = {}
+        for parents in parent_lists:
+            for parent in parents:
+                if not isinstance(parent, str) or not parent.strip():
+                    continue
+                self.index.setdefault(parent.split()[-1].lower(), parent)
+
+    def match_kid(self, kid_name):
+        """Parent whose last name is the kid's first name token, or None."""
+        if not isinstance(kid_name, str) or not kid_name.split():
+            return None
+        return self.index.get(kid_name.split()[0].lower())
+
+
+class ParentNameIndex:
+    """
+    Trigram inverted index over distinct parent names from the bank statement.
+
+    `match` returns the first parent (in the original order) for which
+    `parent in name or (name in parent and len(parent) > 3)` holds, or with
+    `long_only=True`, `(parent in name or name in parent) and len(parent) > 3`.
+    Comparison is on `str(parent)`, the parent object itself is returned.
+
+    A parent contained in `name` must start with one of the trigrams of
+    `name`, and `name` contained in a parent shares every trigram with it, so
+    only a handful of candidates are verified per lookup instead of the whole
+    parent list.
+    """
+
+    def __init__(self, parents, long_only=False):
+        self.parents = list(parents)
+        self.names = [str(parent) for parent in self.parents]
+        self.long_only = long_only
+
+        self.short = []
+        self.long = []
+        self.by_head = defaultdict(list)
+        self.by_gram = defaultdict(list)
+        for pos, name in enumerate(self.names):
+            if len(name) < GRAM:
+                self.short.append(pos)
+            else:
+                self.by_head[name[:GRAM]].append(pos)
+            if len(name) > 3:
+                self.long.append(pos)
+                for gram in trigrams(name):
+                    self.by_gram[gram].append(pos)
+
+    def _contained_in(self, name, grams):
+        """Position of the first parent that is a substring of `name`."""
+        candidates = list(self.short)
+        for gram in grams:
+            candidates.extend(self.by_head.get(gram, ()))
+
+        best = None
+        for pos in candidates:
+            if best is not None and pos >= best:
+                continue
+            parent = self.names[pos]
+            if self.long_only and len(parent) <= 3:
+                continue
+            if parent in name:
+                best = pos
+        return best
+
+    def _containing(self, name, grams, before=None):
+        """Position of the first parent longer than 3 chars that contains `name`."""
+        if len(name) < GRAM:
+            postings = self.long
+        else:
+            postings = min((self.by_gram.get(gram, ()) for gram in grams), key=len)
+
+        for pos in postings:
+            if before is not None and pos >= before:
+                break
+            if name in self.names[pos]:
+                return pos
+        return None
+
+    def match(self, name):
+        """First matching parent for a (cleaned) parent name, or None."""
+        name = str(name)
+        grams = trigrams(name)
+        best = self._contained_in(name, grams)
+        containing = self._containing(name, grams, before=best)
+        if containing is not None:
+            best = containing
+        return None if best is None else self.parents[best]
+
+
+def backup_parent_index(backup_kids_df):
+    """kid_id -> raw parent_name from the unfiltered kids sheet (first row wins)."""
+    first_rows = backup_kids_df.drop_duplicates('kid_id')
+    first_rows = first_rows[first_rows['kid_id'].notna()]
+    return first_rows.set_index('kid_id')['parent_name']
+
+
+def fill_backup_parent_names(kids_parents, backup_kids_df):
+    """
+    Fill empty parent names in place from the backup sheet, in one vectorized step.
+
+    Only the first row of each kid_id is filled and backup names are stored
+    as strings, as the old per-kid fallback loop did.
+    """
+    backup_parents = backup_parent_index(backup_kids_df)
+    kid_ids = kids_parents['kid_id']
+    parent_names = kids_parents['parent_name']
+
+    missing = parent_names.isna() | (parent_names == '')
+    fill = missing & ~kid_ids.duplicated() & kid_ids.isin(backup_parents.index)
+    if fill.any():
+        kids_parents.loc[fill, 'parent_name'] = kid_ids[fill].map(backup_parents).map(str)
+    return kids_parents
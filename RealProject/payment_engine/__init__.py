@@ -0,0 +1,61 @@
+"""
+Payment processing engine: the pipeline stages as an importable package.
+
+Importing the package is cheap and touches no files. Stage functions and
+classes are looked up in the module that implements them (pandas, openpyxl
+and friends) the first time they are used. `python -m payment_engine` runs
+the whole pipeline, see payment_engine.__main__.
+"""
+import importlib
+
+# Public name -> module implementing it
+EXPORTS = {
+    # Inputs
+    "load_inputs": "payment_processor",
+    "load_data": "payment_processor",
+    "load_parent_payments": "payment_processor",
+    "filter_dataframe": "payment_processor",
+    "WorkbookSession": "workbook_session",
+    "InputCache": "input_cache",
+    # Matching and payments
+    "find_kids_of_parents": "payment_processor",
+    "match_kids": "payment_processor",
+    "get_parent_kid_map": "payment_processor",
+    "select_new_bookings": "payment_processor",
+    "build_payment_ledger": "payment_processor",
+    "calculate_months_paid": "payment_processor",
+    "calculate_kid_payments": "payment_processor",
+    "payment_status_text": "payment_processor",
+    "get_monthly_fee_for_class": "payment_processor",
+    # Sheet state and output
+    "get_all_kids_last_updates": "payment_processor",
+    "plan_month_cells": "payment_processor",
+    "build_change_set": "payment_processor",
+    "update_excel_with_payments": "payment_processor",
+    "PaymentStore": "payment_store",
+    "TransactionLedger": "transaction_ledger",
+    "ledger_path": "transaction_ledger",
+    "StageTimer": "stage_timing",
+    # Whole run
+    "run": "payment_engine.runner",
+    "run_pipeline": "payment_processor",
+    "RunContext": "run_context",
+    "default_context": "payment_processor",
+    "CancellationToken": "cancellation",
+    "Cancelled": "cancellation",
+}
+
+__all__ = sorted(EXPORTS)
+
+
+def __getattr__(name):
+    module = EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,39 @@
+import argparse
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m payment_engine",
+        description="Apply a bank statement to the kids payment workbook."
+    )
+    parser.add_argument('--parents', help='Bank statement (.xlsx or German .csv export)')
+    parser.add_argument('--kids', help='Kids workbook to update')
+    parser.add_argument('--output', help='Updated workbook to write')
+    parser.add_argument('--mode', choices=['prod', 'test'], help='"test" processes a limited number of rows')
+    parser.add_argument('--output-mode', choices=['patch', 'save'],
+                        help='"save" always re-serializes the workbook instead of patching the sheet XML')
+    parser.add_argument('--plan', action='store_true',
+                        help='Dry run: write the cell change set instead of an updated workbook')
+    parser.add_argument('--plan-file', help='Change set CSV written by --plan')
+    parser.add_argument('--ledger', help='Payments database shared by the runs (default: payments.sqlite next to --output)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Imported here so that --help does not load pandas
+    from payment_engine.runner import run
+    return run(
+        parent_file=args.parents,
+        kid_file=args.kids,
+        output_file=args.output,
+        mode=args.mode,
+        output_mode=args.output_mode,
+        dry_run=args.plan,
+        plan_file=args.plan_file,
+        ledger_file=args.ledger,
+    )
+
+
+if __name__ == "__main__":
+    main()
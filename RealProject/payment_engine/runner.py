@@ -0,0 +1,23 @@
+import payment_processor as processor
+
+
+def run(parent_file=None, kid_file=None, output_file=None, mode=None, output_mode=None, dry_run=False, plan_file=None,
+        ledger_file=None, context=None):
+    """
+    Run the whole pipeline once and return the output file, or the change set DataFrame for a dry run.
+
+    Arguments left as None keep the settings of `context`, by default
+    payment_processor's (PARENT_FILE, KID_FILE, OUTPUT_FILE, MODE,
+    OUTPUT_MODE, PLAN_FILE, LEDGER_FILE). Module globals are not changed, so runs can
+    execute concurrently.
+    """
+    settings = dict(
+        parent_file=parent_file, kid_file=kid_file, output_file=output_file,
+        mode=mode, output_mode=output_mode, plan_file=plan_file, ledger_file=ledger_file,
+    )
+    settings = {name: value for name, value in settings.items() if value is not None}
+    context = context.updated(**settings) if context is not None else processor.default_context(**settings)
+    if dry_run:
+        return processor.main(dry_run=True, context=context)
+    processor.main(context=context)
+    return context.output_file
@@ -2,8 +2,23 @@ import openpyxl
 from openpyxl.styles import Font, Alignment, PatternFill, Color, Border, Side
 from openpyxl import load_workbook
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from copy import copy
 
+from allocation_engine import allocate_family_payments, classify_payment_statuses, format_status
+from cancellation import CancellationToken, Cancelled, checked, checkpoint
+from excel_writer import StatusStyleCache, apply_column_layout, plan_column_layout, replace_on_success
+from fill_matrix import FillColorCache
+from input_cache import InputCache
+from parent_matcher import LastNameIndex, ParentNameIndex, fill_backup_parent_names
+from payment_store import PaymentStore, normalize_color
+from run_context import RunContext
+from stage_timing import StageTimer
+from statement_reader import iter_statement_chunks
+from transaction_ledger import TransactionLedger, booking_fingerprints, file_hash
+from workbook_session import WorkbookSession
+from xlsx_patcher import PatchUnsupported, patch_month_cells
+
 # ============================================================================
 # CONSTANTS
 # ============================================================================
@@ -49,33 +64,104 @@ PARTIAL_COLOR = "FFFFC000"
 
 # Mode setting
 MODE = "prod"  # Change to "test" for testing with limited rows
+PLAN_FILE = "payment_plan.csv"  # Change set written by a dry run
+OUTPUT_MODE = "patch"  # "save" always re-serializes the workbook with openpyxl
+LEDGER_FILE = None  # Payments database; None keeps it next to the output file
 
 # ============================================================================
 # UTILITY FUNCTIONS
 # ============================================================================
 
-def load_data(parent_file, kid_file):
-    """Load parent and kid data from Excel files."""
-    parents_df = pd.read_excel(parent_file, header=None)
-    kids_df = pd.read_excel(kid_file, header=None)
+def load_parent_payments(parent_file, cache=None):
+    """
+    Load the bank statement; the first row holds the column titles, as with read_excel(header=None).
+    
+    Excel exports keep all columns; German CSV exports are streamed in chunks
+    and only hold the columns the pipeline uses (see statement_reader.PIPELINE_COLUMNS).
+    """
+    if parent_file.lower().endswith(".csv"):
+        # Title row keeps the column dtypes: only the name column carries its title;
+        # the bookings are joined to it in a single concat as they are streamed
+        chunks = iter_statement_chunks(parent_file)
+        first = next(chunks, None)
+        if first is None:
+            raise ValueError(f"Statement {parent_file} has no bookings")
+        titles = pd.DataFrame({
+            column: pd.Series(['Beguenstigter/Zahlungspflichtiger' if column == 'parent_name' else None],
+                              dtype=first[column].dtype)
+            for column in first.columns
+        })
+        return pd.concat([titles, first, *chunks], ignore_index=True)
     
+    if cache is not None:
+        parents_df = cache.read_excel(parent_file, header=None)
+    else:
+        parents_df = pd.read_excel(parent_file, header=None)
+    parents_df.columns = [
+        "Account_Number", "Booking_Date", "Value_Date", "Transaction_Text",
+        "Usage_Purpose", "parent_name", "Account_or_IBAN", "BIC_SWIFT_Code",
+        "Amount", "Currency", "Info"
+    ]
+    return parents_df
+
+
+def build_parent_name_index(parents_df):
+    """ParentNameIndex over the distinct payer names of a statement."""
+    return ParentNameIndex(parents_df['parent_name'].dropna().unique())
+
+
+def load_statement(parent_file, cache=None, timer=None):
+    """Statement and its parent-name index, for running on a loader thread."""
+    timer = timer or StageTimer()
+    parents_df = timer.timed("statement", load_parent_payments, parent_file, cache=cache)
+    parent_name_index = timer.timed("parent name index", build_parent_name_index, parents_df)
+    return parents_df, parent_name_index
+
+
+def load_inputs(parent_file, kid_file, session=None, timer=None, debug_export=None):
+    """
+    Load both inputs concurrently; returns load_data's tuple plus the parent-name index.
+
+    The statement is read, and its parent-name index built, on a loader
+    thread while the kids workbook is parsed on the calling thread.
+    debug_export: see prepare_kids_frame.
+    """
+    if session is None:
+        session = WorkbookSession(kid_file)
+    timer = timer or StageTimer()
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="statement") as pool:
+        statement = pool.submit(load_statement, parent_file, session.cache, timer)
+        with timer.stage("kids workbook"):
+            kids_df = session.frame(header=None)
+            last_column = session.max_column
+        with timer.stage("kids frame"):
+            kids_df, kids_first_rows, months = prepare_kids_frame(kids_df, last_column, debug_export)
+        parents_df, parent_name_index = statement.result()
+    return parents_df, kids_df, kids_first_rows, months, parent_name_index
+
+
+def load_data(parent_file, kid_file, session=None):
+    """Load parent and kid data from Excel files."""
+    return load_inputs(parent_file, kid_file, session=session)[:4]
+
+
+def prepare_kids_frame(kids_df, last_column, debug_export=None):
+    """
+    Split the header rows off the kids sheet and name its columns; returns (kids_df, first_rows, months).
+
+    debug_export: file to export the sheet before filtering to (a run's
+    RunContext.debug_export_file), or None.
+    """
     kids_first_rows = kids_df.iloc[:3]
     kids_df = kids_df.iloc[3:]
     print(kids_df.head())
     kids_df = kids_df.reset_index(drop=True)
     print(f"Kids before filtering:")
     #exporting 
-    kids_df.to_excel("kids_debug_before_filtering.xlsx", index=False)
+    if debug_export:
+        kids_df.to_excel(debug_export, index=False)
     print("---------")
-    parents_df.columns = [
-        "Account_Number", "Booking_Date", "Value_Date", "Transaction_Text",
-        "Usage_Purpose", "parent_name", "Account_or_IBAN", "BIC_SWIFT_Code",
-        "Amount", "Currency", "Info"
-    ]
     
-    wb = load_workbook(kid_file)
-    ws = wb.active
-    last_column = ws.max_column
     # print(f"Last column in kids file: {last_column}")
     months = MONTHS_1_5_YEARS if last_column < 25 else MONTHS_2_YEARS
     
@@ -90,7 +176,7 @@ def load_data(parent_file, kid_file):
             'class', 'priceOn', 'book_taken', 'nabil_liste', 'phone_number'
         ]
     
-    return parents_df, kids_df, kids_first_rows, months
+    return kids_df, kids_first_rows, months
 
 
 def filter_dataframe(kids_df, mode):
@@ -115,13 +201,33 @@ def filter_dataframe(kids_df, mode):
     return kids_df, kids_last_rows, backup_kids_df
 
 
-def get_monthly_fee_for_class(class_name):
-    """Get monthly fee based on class name."""
-    if class_name in A5_NAMES:
-        return MONTHLY_FEE_A
-    if class_name in B0_NAMES:
-        return MONTHLY_FEE_B
-    return MONTHLY_FEE_A
+def default_context(**settings):
+    """
+    RunContext from the settings at the top of this module, with some of them replaced.
+
+    The module settings are read when called, so scripts that assign them
+    before main() still work; concurrent runs each build their own context.
+    """
+    defaults = dict(
+        parent_file=PARENT_FILE,
+        kid_file=KID_FILE,
+        output_file=OUTPUT_FILE,
+        mode=MODE,
+        monthly_fee_a=MONTHLY_FEE_A,
+        monthly_fee_b=MONTHLY_FEE_B,
+        a_classes=A5_NAMES,
+        b_classes=B0_NAMES,
+        output_mode=OUTPUT_MODE,
+        plan_file=PLAN_FILE,
+        ledger_file=LEDGER_FILE,
+    )
+    defaults.update(settings)
+    return RunContext(**defaults)
+
+
+def get_monthly_fee_for_class(class_name, context=None):
+    """Get monthly fee based on class name, from the context's fee set (module settings by default)."""
+    return (context or default_context()).monthly_fee(class_name)
 
 
 def text_to_color(status_text):
@@ -166,8 +272,12 @@ def copy_cell_format(source_cell, target_cell):
 # CORE PROCESSING FUNCTIONS
 # ============================================================================
 
-def find_kids_of_parents(parents_df, kids_df, backup_kids_df):
-    """Find and match kids with their parents."""
+def find_kids_of_parents(parents_df, kids_df, backup_kids_df, parent_name_index=None, cancel=None):
+    """
+    Find and match kids with their parents; parent_name_index may be prebuilt from parents_df.
+
+    cancel: optional CancellationToken, checked while matching rows.
+    """
     distinct_parents = parents_df['parent_name'].dropna().unique()
     kids_parents_from_kids = kids_df[['kid_id', 'kid_name', 'parent_name', 'class']].copy()
     
@@ -179,53 +289,24 @@ def find_kids_of_parents(parents_df, kids_df, backup_kids_df):
     kids_parents_from_kids = kids_parents_from_kids[kids_parents_from_kids['parent_name'].notna()]
     other_distinct_parents = kids_parents_from_kids['parent_name'].dropna().unique()
     
+    # Indexes are built once per run; lookups return the same first match as a linear scan
+    last_name_index = LastNameIndex(other_distinct_parents, distinct_parents)
+    if parent_name_index is None:
+        parent_name_index = ParentNameIndex(distinct_parents)
+    
     # Complete missing parent names
-    for index, row in empty_kids_parents.iterrows():
-        kid_name = row['kid_name']
-        matched_parent = None
-        
-        for parent in other_distinct_parents:
-            if not isinstance(parent, str) or not parent.strip():
-                continue
-            last_name_parent = parent.split()[-1]
-            if kid_name and kid_name.split() and last_name_parent.lower() == kid_name.split()[0].lower():
-                matched_parent = parent
-                break
-        
-        if not matched_parent:
-            for parent in distinct_parents:
-                if not isinstance(parent, str) or not parent.strip():
-                    continue
-                last_name_parent = parent.split()[-1]
-                if kid_name and kid_name.split() and last_name_parent.lower() == kid_name.split()[0].lower():
-                    matched_parent = parent
-                    break
-        
+    matched_parents = [last_name_index.match_kid(kid_name) for kid_name in checked(empty_kids_parents['kid_name'], cancel)]
+    for index, matched_parent in zip(empty_kids_parents.index, matched_parents):
         if matched_parent:
             empty_kids_parents.at[index, 'parent_name'] = matched_parent
-        else:
-            for kid_id in empty_kids_parents['kid_id']:
-                idx = empty_kids_parents.index[empty_kids_parents['kid_id'] == kid_id][0]
-                if pd.isna(empty_kids_parents.at[idx, 'parent_name']) or empty_kids_parents.at[idx, 'parent_name'] == '':
-                    parent_name = backup_kids_df.loc[backup_kids_df['kid_id'] == kid_id, 'parent_name'].values
-                    if len(parent_name) > 0:
-                        empty_kids_parents.at[idx, 'parent_name'] = str(parent_name[0])
+    
+    # Kids still without a parent take the raw name from the backup sheet
+    if not all(matched_parents):
+        fill_backup_parent_names(empty_kids_parents, backup_kids_df)
     
     # Replace parent names with matching distinct parents
-    for index, row in kids_parents_from_kids.iterrows():
-        current_parent_name = row['parent_name']
-        matched_parent = None
-        
-        for parent in distinct_parents:
-            try:
-                parent_str = str(parent)
-                current_parent_name_str = str(current_parent_name)
-                if parent_str in current_parent_name_str or current_parent_name_str in parent_str and len(parent_str) > 3:
-                    matched_parent = parent
-                    break
-            except TypeError:
-                continue
-        
+    matched_parents = [parent_name_index.match(name) for name in checked(kids_parents_from_kids['parent_name'], cancel)]
+    for index, matched_parent in zip(kids_parents_from_kids.index, matched_parents):
         if matched_parent:
             kids_parents_from_kids.at[index, 'parent_name'] = matched_parent
     
@@ -235,6 +316,19 @@ def find_kids_of_parents(parents_df, kids_df, backup_kids_df):
     return combined
 
 
+def match_kids(parents_df, kids_df, backup_kids_df, parent_name_index=None, cache=None, cancel=None):
+    """find_kids_of_parents, memoized in the input cache on the columns matching reads."""
+    build = lambda: find_kids_of_parents(parents_df, kids_df, backup_kids_df, parent_name_index, cancel=cancel)
+    if cache is None:
+        return build()
+    inputs = [
+        parents_df[['parent_name']],
+        kids_df[['kid_id', 'kid_name', 'parent_name', 'class']],
+        backup_kids_df[['kid_id', 'parent_name']],
+    ]
+    return cache.stage_frame("match", inputs, build)
+
+
 def get_parent_kid_map(combined_df):
     """Create mapping of parents to their kids."""
     df_valid = combined_df[combined_df['parent_name'].notna() & (combined_df['parent_name'].str.strip() != '')]
@@ -248,56 +342,92 @@ def get_parent_kid_map(combined_df):
     return result
 
 
-def calculate_months_paid(parents_df):
-    """Calculate total amount paid by each parent."""
+def build_payment_ledger(parents_df):
+    """
+    Aggregate every transaction per parent in one groupby.
+    
+    Returns a DataFrame indexed by parent_name with total_amount,
+    transfer_count, first_booking_date and last_booking_date.
+    """
+    transactions = parents_df.iloc[1:]
+    bookings = pd.DataFrame({
+        'parent_name': transactions['parent_name'],
+        'Amount': pd.to_numeric(transactions['Amount'], errors='coerce'),
+        'Booking_Date': pd.to_datetime(transactions['Booking_Date'], errors='coerce', dayfirst=True)
+    })
+    ledger = bookings.groupby('parent_name', sort=False).agg(
+        total_amount=('Amount', 'sum'),
+        transfer_count=('Amount', 'count'),
+        first_booking_date=('Booking_Date', 'min'),
+        last_booking_date=('Booking_Date', 'max')
+    )
+    return ledger
+
+
+def select_new_bookings(parents_df, transaction_ledger, workbook_hash):
+    """
+    Statement rows not yet applied to this workbook.
+    
+    Returns (new_df, fingerprints, incremental): new_df keeps the title row,
+    fingerprints identify its bookings, and incremental is True when earlier
+    runs were applied to the workbook (only families with new bookings need
+    updating then).
+    """
+    bookings = parents_df.iloc[1:]
+    fingerprints = booking_fingerprints(bookings)
+    run_ids = transaction_ledger.lineage(workbook_hash)
+    is_new = ~fingerprints.isin(transaction_ledger.applied_fingerprints(run_ids))
+    new_df = pd.concat([parents_df.iloc[:1], bookings[is_new]])
+    return new_df, fingerprints[is_new], bool(run_ids)
+
+
+def calculate_months_paid(parents_df, ledger=None):
+    """Calculate total amount paid by each parent, summed over all their transfers."""
     parents_df['Amount'] = pd.to_numeric(parents_df['Amount'], errors='coerce')
-    df_filtered = parents_df.iloc[1:].copy()
-    parents_amount = dict(zip(df_filtered['parent_name'], df_filtered['Amount']))
-    return parents_amount
+    if ledger is None:
+        ledger = build_payment_ledger(parents_df)
+    return ledger['total_amount'].to_dict()
 
 
-def get_last_kid_update(sheet, df, row_idx, months):
+def get_last_kid_update(sheet, df, row_idx, months, colors=None):
     """Get the last update (month, text, color) for a single kid."""
+    if colors is None:
+        colors = FillColorCache(sheet.parent, to_text=color_to_text)
     last_update = {"month": None, "text": None, "color": None}
     
     for month in reversed(months):
         col_idx = df.columns.get_loc(month) + 1
         cell = sheet.cell(row=row_idx, column=col_idx)
         text = str(cell.value).strip() if cell.value else ""
-        
-        color = None
-        try:
-            fill_color = cell.fill.start_color
-            if isinstance(fill_color, Color):
-                if fill_color.rgb and isinstance(fill_color.rgb, str):
-                    color = fill_color.rgb
-                elif fill_color.indexed is not None:
-                    color = str(fill_color.indexed)
-                elif fill_color.theme is not None:
-                    color = f"theme:{fill_color.theme}"
-            else:
-                color = None
-        except Exception:
-            color = "FF595959"
+        color = colors.color(cell)
         
         if color == "FFFF0000":
             continue
         
         if text or (color and color not in ["00000000", "None", ""]):
-            if "Values must be of type <class 'int'>" in str(color):
-                color = "FF595959"
             last_update = {"month": month, "text": text or None, "color": color}
             break
     
     return last_update
 
 
-def get_all_kids_last_updates(file_path, months):
-    """Get last update for all kids."""
-    wb = load_workbook(file_path, data_only=True)
-    sheet = wb.active
-    df = pd.read_excel(file_path)
-    last_column = sheet.max_column
+def get_all_kids_last_updates(file_path, months, session=None, store=None, cancel=None):
+    """
+    Get last update for all kids.
+
+    When `store` describes this workbook the answer comes from it; otherwise
+    the sheet is scanned and, with a store, imported into it. cancel is an
+    optional CancellationToken, checked between the scan steps and rows.
+    """
+    if session is None:
+        session = WorkbookSession(file_path)
+    if store is not None:
+        last_updates = store.last_updates(months, session.content_hash)
+        if last_updates is not None:
+            print("🗄️ Kids status read from the payment store.")
+            return last_updates
+    df = session.frame(header=0)
+    last_column = session.max_column
     df = df.iloc[1:]
     
     if last_column < 25:
@@ -305,214 +435,142 @@ def get_all_kids_last_updates(file_path, months):
     else:
         df.columns = ["kid_id", 'kid_name', 'parent_name', *months, 'class', 'priceOn', 'book_taken', 'nabil_liste', 'phone_number']
     
-    results = []
-    for index, row in df.iterrows():
-        kid_name = row['kid_name']
-        if pd.isna(kid_name):
+    kids = df[df['kid_name'].notna()]
+    if kids.empty:
+        return pd.DataFrame([])
+    
+    # One pass over the month block of the sheet, then a reverse argmax per kid
+    excel_rows = kids.index.to_numpy() + 2
+    month_start_col = df.columns.get_loc(months[0]) + 1
+    month_end_col = df.columns.get_loc(months[-1]) + 1
+    checkpoint(cancel)
+    matrix = session.fill_matrix(int(excel_rows.min()), int(excel_rows.max()), month_start_col, month_end_col,
+                                 cancel=cancel)
+    
+    checkpoint(cancel)
+    if store is not None:
+        store.import_sheet(kids, excel_rows, matrix, session.content_hash)
+    
+    row_positions = excel_rows - matrix.min_row
+    last_columns = matrix.last_update_columns()[row_positions]
+    
+    last_months, last_texts, last_colors = [], [], []
+    for i, j in checked(zip(row_positions, last_columns), cancel):
+        if j < 0:
+            last_months.append(None)
+            last_texts.append(None)
+            last_colors.append(None)
             continue
-        
-        excel_row_idx = index + 2
-        update = get_last_kid_update(sheet, df, excel_row_idx, months)
-        
-        results.append({
-            "kid_id": row["kid_id"],
-            "kid_name": kid_name,
-            "parent_name": row["parent_name"],
-            "last_month": update["month"],
-            "last_text": update["text"],
-            "last_color": update["color"]
-        })
+        last_months.append(months[j])
+        last_texts.append(matrix.text_at(i, j))
+        last_colors.append(matrix.color_at(i, j))
     
-    return pd.DataFrame(results)
+    return pd.DataFrame({
+        "kid_id": kids["kid_id"].tolist(),
+        "kid_name": kids["kid_name"].tolist(),
+        "parent_name": kids["parent_name"].tolist(),
+        "last_month": last_months,
+        "last_text": last_texts,
+        "last_color": last_colors
+    })
 
 
 def determine_status_and_color(months_paid, monthly_fee, allocated_amount, class_name):
     """Determine payment status and color based on amount paid."""
-    if monthly_fee <= 0:
-        return "Not yet registered", "FF595959"
-    
-    if allocated_amount == 0:
-        return "Nothing paid.", "FFFF0000"
-    
-    if months_paid >= 1.0:
-        return "Fully paid.", "FF92D050"
-    
-    if class_name.strip() == 'A5' and abs(allocated_amount - 15) < 0.01:
-        return "G1 and G2 paid €15 instead of €25.", "FFFFFF00"
-    
-    if class_name.strip() == 'A5':
-        if allocated_amount in [10, 15, 20]:
-            return "Transfers only €10, €15, or €20 instead of €25.", "FFC65911"
-    elif class_name.strip() == 'B0':
-        if allocated_amount in [10]:
-            return "Transfers only €10 instead of €15.", "FFC65911"
-    
-    return f"Partial payment: {allocated_amount:.2f}€ ({months_paid:.2f} months)", "FFFFC000"
+    status_codes, colors = classify_payment_statuses(
+        [months_paid], [monthly_fee], [allocated_amount], [class_name]
+    )
+    return format_status(status_codes[0], allocated_amount, months_paid), colors[0]
 
 
-def calculate_kid_payments(data_map, amount_map, kid_status):
+def build_kids_allocation_table(data_map, context=None):
+    """One row per kid of every family in data_map, in family order; fees from the context."""
+    context = context or default_context()
+    rows = [
+        (parent, kid_name, class_name)
+        for parent, kids in data_map.items()
+        for kid_name, class_name in kids.items()
+    ]
+    kids_table = pd.DataFrame(rows, columns=['family', 'kid_name', 'class'])
+    kids_table['monthly_fee'] = [context.monthly_fee(class_name) for class_name in kids_table['class']]
+    return kids_table
+
+
+def calculate_kid_payments(data_map, amount_map, kid_status, cancel=None, context=None):
     """
     kid_status: dict {kid_name: {'allocated_amount': float, 'class': str, 'monthly_fee': float}}
+    amount_map: new payment per parent; families missing from it get 0 and
+        are flagged with new_bookings False
+    cancel: optional CancellationToken, checked between kids
+    context: RunContext whose fee set applies (module settings by default)
     """
     kid_payment_status = {}
 
-    # Build prior allocation map per kid and per parent
-    prior_kid_alloc = {}
+    # Build prior allocation total per parent
     prior_parent_total = {}
-    for kid_name, info in kid_status.items():
+    for kid_name, info in checked(kid_status.items(), cancel):
         alloc = float(info.get('allocated_amount', 0.0))
-        prior_kid_alloc[kid_name] = alloc
         parent = info.get('parent', '')
         if parent:
             prior_parent_total[parent] = prior_parent_total.get(parent, 0.0) + alloc
     print(data_map)
-    for parent, kids in data_map.items():
-        new_payment = float(amount_map.get(parent, 0.0))
-        prior_total = prior_parent_total.get(parent, 0.0)
-        total_effective_amount = prior_total + new_payment
-
-        # print(f"\nParent: {parent}, New Payment: €{new_payment}, Prior Total: €{prior_total}, Effective Total: €{total_effective_amount}")
-
-        # Get monthly fees
-        kid_list = list(kids.items())
-        kid_fees = {}
-        total_monthly_fee = 0.0
-        for kid, cls in kid_list:
-            fee = get_monthly_fee_for_class(cls)
-            kid_fees[kid] = fee
-            total_monthly_fee += fee
-
-        # print(f"Total Monthly Fee for {parent}: €{total_monthly_fee}")
-
-        if total_monthly_fee <= 0:
-            for kid_name, class_name in kid_list:
-                status_msg, color = determine_status_and_color(0, 0, 0, class_name)
-                kid_payment_status[kid_name] = {
-                    'parent': parent,
-                    'class': class_name.strip(),
-                    'monthly_fee': 0.0,
-                    'allocated_amount': 0.0,
-                    'months_paid': 0.0,
-                    'status': status_msg,
-                    'color': color,
-                    'extras': 0.0,
-                    'extras_color': color
-                }
-            continue
 
-        # Compute full months and remainder from TOTAL effective amount
-        full_months_total = int(total_effective_amount // total_monthly_fee)
-        remainder = total_effective_amount - (full_months_total * total_monthly_fee)
+    # Effective amount per family = prior allocations + new payment
+    family_payments = {
+        parent: prior_parent_total.get(parent, 0.0) + float(amount_map.get(parent, 0.0))
+        for parent in data_map
+    }
+    checkpoint(cancel)
+    allocation = allocate_family_payments(build_kids_allocation_table(data_map, context), family_payments)
+
+    allocation['status_code'], allocation['color'] = classify_payment_statuses(
+        allocation['months_paid'], allocation['monthly_fee'],
+        allocation['allocated_amount'], allocation['class']
+    )
 
-        # Base allocation per kid
-        base_allocations = {
-            kid_name: full_months_total * kid_fees[kid_name]
-            for kid_name, _ in kid_list
+    columns = ['family', 'kid_name', 'class', 'monthly_fee', 'allocated_amount', 'months_paid', 'extras',
+               'status_code', 'color']
+    for parent, kid_name, class_name, monthly_fee, allocated, months_paid, extras, status_code, color in checked(zip(
+        *(allocation[column].tolist() for column in columns)
+    ), cancel):
+        if monthly_fee > 0:
+            extras = round(extras, 2)
+            extras_color = "#ffc000" if extras > 1e-2 else "#92d050"
+        else:
+            extras = 0.0
+            extras_color = color
+
+        kid_payment_status[kid_name] = {
+            'parent': parent,
+            'class': class_name.strip(),
+            'monthly_fee': round(monthly_fee, 2),
+            'allocated_amount': round(allocated, 2),          # cumulative
+            'months_paid': round(months_paid, 2),
+            'status_code': status_code,                       # text via payment_status_text
+            'color': color,
+            'extras': extras,
+            'extras_color': extras_color,
+            'new_bookings': parent in amount_map
         }
 
-        # Assign remainder to FIRST kid (as before)
-        allocations = {}
-        for i, (kid_name, _) in enumerate(kid_list):
-            if i == 0:
-                allocations[kid_name] = base_allocations[kid_name] + remainder
-            else:
-                allocations[kid_name] = base_allocations[kid_name]
-
-        # Now build result using CUMULATIVE allocations
-        for kid_name, class_name in kid_list:
-            monthly_fee = kid_fees[kid_name]
-            allocated = allocations[kid_name]  # cumulative
+    return kid_payment_status
 
-            months_paid = allocated / monthly_fee if monthly_fee > 0 else 0.0
 
-            status_msg, color = determine_status_and_color(
-                months_paid, monthly_fee, allocated, class_name
-            )
+def payment_status_text(payment_info):
+    """Status text of a kid_payment_status entry, only formatted when it is written out."""
+    return format_status(payment_info['status_code'], payment_info['allocated_amount'], payment_info['months_paid'])
 
-            if monthly_fee > 0:
-                full_months_for_kid = int(allocated // monthly_fee)
-                extras = allocated - (full_months_for_kid * monthly_fee)
-                extras = round(extras, 2)
-                extras_color = "#ffc000" if extras > 1e-2 else "#92d050"
-            else:
-                extras = 0.0
-                extras_color = color
-
-            allocated = round(allocated, 2)
-            months_paid = round(months_paid, 2)
-            monthly_fee = round(monthly_fee, 2)
-
-            kid_payment_status[kid_name] = {
-                'parent': parent,
-                'class': class_name.strip(),
-                'monthly_fee': monthly_fee,
-                'allocated_amount': allocated,          # cumulative
-                'months_paid': months_paid,
-                'status': status_msg,
-                'color': color,
-                'extras': extras,
-                'extras_color': extras_color
-            }
-
-            # print(f"  → {kid_name}: €{allocated:.2f} allocated → {months_paid:.2f} months → {status_msg}")
-            # if extras > 0:
-            #     print(f"      (Extras: €{extras:.2f})")
-
-    return kid_payment_status
 
+def plan_month_cells(kids_df, kid_payment_status, kids_status, months_extended, cancel=None, incremental=False):
+    """
+    Month cells to write for every kid with a payment status.
 
-def update_excel_with_payments(kids_df, kid_payment_status, kids_status, months, kid_file, output_file):
-    """Update Excel file with payment statuses."""
-    wb = load_workbook(kid_file)
-    ws = wb.active
-    
-    months_extended = MONTHS_2_YEARS
-    original_month_count = len(months)
-    new_month_count = len(months_extended)
-    months_to_add = new_month_count - original_month_count
-    
-    month_start_col = 4
-    month_end_col = month_start_col + original_month_count - 1
-    reference_month_cell = ws.cell(row=4, column=month_start_col)
-    
-    last_expected_col = month_start_col + new_month_count - 1
-    already_extended = False
-    
-    if ws.max_column >= last_expected_col:
-        last_month_header = ws.cell(row=3, column=last_expected_col).value
-        if last_month_header and str(last_month_header).strip() in ['8', '8_next']:
-            already_extended = True
-            print("✅ Months already extended to 2 years.")
-    
-    if months_to_add > 0 and not already_extended:
-        print(f"➕ Adding {months_to_add} new month columns...")
-        for _ in range(months_to_add):
-            ws.insert_cols(month_end_col + 1)
-        
-        year_2026_start_col = month_start_col + 16
-        ws.merge_cells(start_row=2, start_column=year_2026_start_col, end_row=2, end_column=year_2026_start_col + months_to_add)
-        year_2026_cell = ws.cell(row=2, column=year_2026_start_col)
-        
-        bold_border = Border(
-            left=Side(style='thin', color='000000'),
-            right=Side(style='thin', color='000000'),
-            top=Side(style='thin', color='000000'),
-            bottom=Side(style='thin', color='000000')
-        )
-        year_2026_cell.border = bold_border
-        
-        for i, month in enumerate(months_extended):
-            col_idx = month_start_col + i
-            month_num_cell = ws.cell(row=3, column=col_idx)
-            
-            if i >= original_month_count:
-                display_month = month.replace('_next', '')
-                month_num_cell.value = display_month
-                source_col_offset = i % 12
-                source_col = month_start_col + source_col_offset
-                source_month_num = ws.cell(row=3, column=source_col)
-                copy_cell_format(source_month_num, month_num_cell)
-    
+    Returns (excel_row, month_index, value, color, copy_format) tuples; value
+    None leaves the cell's content as is and only colours it. With
+    incremental (the workbook already holds earlier runs) kids whose family
+    has no new bookings are left as they are: their cells already show
+    everything applied to them.
+    """
     kids_status_dict = {}
     for _, row in kids_status.iterrows():
         kid_name = row['kid_name']
@@ -522,21 +580,9 @@ def update_excel_with_payments(kids_df, kid_payment_status, kids_status, months,
             'last_color': row['last_color']
         }
     
-    parent_name_col = 3
-    last_column = ws.max_column
-    phone_col_exists = ws.max_column >= 32
-    phone_number_column = last_column
-    
-    if not phone_col_exists:
-        print("➕ Adding phone number column...")
-        ws.insert_cols(last_column + 1)
-        phone_header_cell = ws.cell(row=3, column=phone_number_column + 1)
-        phone_header_cell.value = "Phone Number"
-        parent_header_cell = ws.cell(row=3, column=parent_name_col)
-        copy_cell_format(parent_header_cell, phone_header_cell)
-    
+    month_cells = []
     start_row = 4
-    for idx, kid_row in kids_df.iterrows():
+    for idx, kid_row in checked(kids_df.iterrows(), cancel):
         excel_row = start_row + idx
         kid_name = kid_row['kid_name']
         
@@ -547,6 +593,9 @@ def update_excel_with_payments(kids_df, kid_payment_status, kids_status, months,
         if not payment_info:
             continue
         
+        if incremental and not payment_info.get('new_bookings', True):
+            continue
+        
         last_status = kids_status_dict.get(kid_name, {})
         last_month = last_status.get('last_month')
         last_color = (last_status.get('last_color') or "").upper().replace("#", "")
@@ -563,32 +612,172 @@ def update_excel_with_payments(kids_df, kid_payment_status, kids_status, months,
         months_paid = payment_info.get('months_paid', 0.0)
         full_months_paid = int(months_paid)
         monthly_fee = payment_info.get('monthly_fee', 0.0)
-        new_color = payment_info.get('color', 'FF595959')
+        new_color = payment_info.get('color', 'FF595959').replace("#", "")
         extras = payment_info.get('extras', 0.0)
-        extras_color = payment_info.get('extras_color', '#92d050')
+        extras_color = payment_info.get('extras_color', '#92d050').replace("#", "")
         
-        for i, month in enumerate(months_extended):
-            col_idx = month_start_col + i
-            cell = ws.cell(row=excel_row, column=col_idx)
-            
-            if i <= last_month_idx:
-                continue
-            elif i <= last_month_idx + full_months_paid:
+        for i in range(last_month_idx + 1, len(months_extended)):
+            if i <= last_month_idx + full_months_paid:
                 if monthly_fee > 0:
-                    cell.value = int(monthly_fee) if monthly_fee == int(monthly_fee) else monthly_fee
+                    value = int(monthly_fee) if monthly_fee == int(monthly_fee) else monthly_fee
                 else:
-                    cell.value = ""
-                copy_cell_format(reference_month_cell, cell)
-                cell.fill = PatternFill(start_color=new_color.replace("#", ""), end_color=new_color.replace("#", ""), fill_type="solid")
+                    value = ""
+                month_cells.append((excel_row, i, value, new_color, True))
             elif i == last_month_idx + full_months_paid + 1 and extras > 0:
-                cell.value = extras if extras != int(extras) else int(extras)
-                copy_cell_format(reference_month_cell, cell)
-                cell.fill = PatternFill(start_color=extras_color.replace("#", ""), end_color=extras_color.replace("#", ""), fill_type="solid")
-            else:
-                if i == last_month_idx + full_months_paid + 1 and extras == 0:
-                    cell.fill = PatternFill(start_color="FFFF0000", end_color="FFFF0000", fill_type="solid")
+                value = extras if extras != int(extras) else int(extras)
+                month_cells.append((excel_row, i, value, extras_color, True))
+            elif i == last_month_idx + full_months_paid + 1 and extras == 0:
+                month_cells.append((excel_row, i, None, "FFFF0000", False))
+    
+    return month_cells
+
+
+def render_workbook(wb, layout, month_cells, months, months_extended, output_file, cancel=None):
+    """Apply the column layout and the month cells with openpyxl and save the whole workbook."""
+    ws = wb.active
+    original_month_count = len(months)
+    month_start_col = layout.month_start_col
+    reference_month_cell = ws.cell(row=4, column=month_start_col)
+    months_to_add = layout.months_to_add
     
+    if months_to_add > 0:
+        print(f"➕ Adding {months_to_add} new month columns...")
+        apply_column_layout(ws, layout)
+        
+        year_2026_start_col = month_start_col + 16
+        ws.merge_cells(start_row=2, start_column=year_2026_start_col, end_row=2, end_column=year_2026_start_col + months_to_add)
+        year_2026_cell = ws.cell(row=2, column=year_2026_start_col)
+        
+        bold_border = Border(
+            left=Side(style='thin', color='000000'),
+            right=Side(style='thin', color='000000'),
+            top=Side(style='thin', color='000000'),
+            bottom=Side(style='thin', color='000000')
+        )
+        year_2026_cell.border = bold_border
+        
+        for i, month in enumerate(months_extended):
+            col_idx = month_start_col + i
+            month_num_cell = ws.cell(row=3, column=col_idx)
+            
+            if i >= original_month_count:
+                display_month = month.replace('_next', '')
+                month_num_cell.value = display_month
+                source_col_offset = i % 12
+                source_col = month_start_col + source_col_offset
+                source_month_num = ws.cell(row=3, column=source_col)
+                copy_cell_format(source_month_num, month_num_cell)
+    
+    parent_name_col = 3
+    if layout.add_phone:
+        print("➕ Adding phone number column...")
+        phone_header_cell = ws.cell(row=3, column=layout.phone_column)
+        phone_header_cell.value = "Phone Number"
+        parent_header_cell = ws.cell(row=3, column=parent_name_col)
+        copy_cell_format(parent_header_cell, phone_header_cell)
+    
+    # Style records are resolved once per colour and shared by every written cell
+    status_styles = StatusStyleCache(wb, reference_month_cell)
+    for excel_row, month_index, value, color, copy_format in checked(month_cells, cancel):
+        cell = ws.cell(row=excel_row, column=month_start_col + month_index)
+        if value is not None:
+            cell.value = value
+        status_styles.apply(cell, color, copy_format=copy_format)
+    
+    checkpoint(cancel)
     wb.save(output_file)
+
+
+def build_change_set(month_cells, kids_df, old_cells, months_extended, kid_payment_status):
+    """
+    Compact change set of planned month cells: one row per cell whose value or colour changes.
+
+    old_cells: {(excel_row, month_index): (text, color)} of the current sheet,
+    e.g. PaymentStore.month_cells; cells missing from it are empty. Every row
+    carries the kid's payment status text.
+    """
+    rows = []
+    status_texts = {}
+    start_row = 4
+    for excel_row, month_index, value, color, _ in month_cells:
+        old_value, old_color = old_cells.get((excel_row, month_index), (None, None))
+        new_color = normalize_color(color)
+        new_value = old_value if value is None else ((str(value).strip() if value else "") or None)
+        if new_value == old_value and new_color == old_color:
+            continue
+        kid = kids_df.loc[excel_row - start_row]
+        if kid['kid_name'] not in status_texts:
+            status_texts[kid['kid_name']] = payment_status_text(kid_payment_status[kid['kid_name']])
+        rows.append((kid['kid_id'], kid['kid_name'], months_extended[month_index],
+                     old_value, old_color, new_value, new_color, status_texts[kid['kid_name']]))
+    return pd.DataFrame(rows, columns=['kid_id', 'kid_name', 'month', 'old_value', 'old_color', 'new_value', 'new_color',
+                                       'status'])
+
+
+def write_change_set(kids_df, kid_payment_status, kids_status, store, workbook_hash, plan_file, cancel=None,
+                     incremental=False):
+    """Plan the month cells, diff them against the input workbook's state in the store and save the change set as CSV."""
+    month_cells = plan_month_cells(kids_df, kid_payment_status, kids_status, MONTHS_2_YEARS, cancel=cancel,
+                                   incremental=incremental)
+    old_cells = store.month_cells((row for row, *_ in month_cells), workbook_hash)
+    changes = build_change_set(month_cells, kids_df, old_cells, MONTHS_2_YEARS, kid_payment_status)
+    changes.to_csv(plan_file, index=False)
+    print(f"\n📝 Dry run: {len(changes)} cell changes for {changes['kid_name'].nunique()} kids written to '{plan_file}'.")
+    return changes
+
+
+def update_excel_with_payments(kids_df, kid_payment_status, kids_status, months, kid_file, output_file, session=None,
+                               store=None, output_mode=None, cancel=None, incremental=False):
+    """
+    Update Excel file with payment statuses; with a store, the written month cells are recorded in it.
+
+    In "patch" output mode a sheet whose columns stay as they are is written
+    by rewriting only its XML in the original xlsx; otherwise, or when the
+    file cannot be patched, the workbook is saved with openpyxl. The file is
+    written next to output_file and only moved over it once complete, so a
+    run cancelled through `cancel` (a CancellationToken) or failing midway
+    leaves the previous output as it was. incremental: see plan_month_cells.
+    """
+    if session is None:
+        session = WorkbookSession(kid_file)
+    output_mode = output_mode or OUTPUT_MODE
+    
+    months_extended = MONTHS_2_YEARS
+    month_start_col = 4
+    
+    # Final column map (24 months, class columns, phone) is planned up front
+    # and every cell is moved once, instead of one insert_cols per month
+    month_headers = session.frame(header=None).iloc[2].tolist()
+    layout = plan_column_layout(session.max_column, month_headers, month_start_col, months, months_extended)
+    
+    if layout.already_extended:
+        print("✅ Months already extended to 2 years.")
+    
+    # The sheet is rendered from the planned month cells, which also go to the store
+    month_cells = plan_month_cells(kids_df, kid_payment_status, kids_status, months_extended, cancel=cancel,
+                                   incremental=incremental)
+    
+    with replace_on_success(output_file) as temp_file:
+        patched = False
+        if output_mode == "patch" and layout.months_to_add == 0 and not layout.add_phone:
+            checkpoint(cancel)
+            try:
+                patch_month_cells(
+                    session.data, temp_file,
+                    [(row, month_start_col + i, value, color, copy_format)
+                     for row, i, value, color, copy_format in month_cells],
+                    reference=(4, month_start_col)
+                )
+                patched = True
+                print(f"🩹 Patched {len(month_cells)} month cells into the sheet XML.")
+            except PatchUnsupported as e:
+                print(f"⚠️ Cannot patch the workbook in place ({e}), saving it with openpyxl.")
+        
+        if not patched:
+            render_workbook(session.workbook, layout, month_cells, months, months_extended, temp_file, cancel=cancel)
+    
+    if store is not None:
+        store.record_render(month_cells, session.content_hash, file_hash(output_file))
     print(f"\n✅ Excel file updated successfully: {output_file}")
     return output_file
 
@@ -597,64 +786,150 @@ def update_excel_with_payments(kids_df, kid_payment_status, kids_status, months,
 # MAIN FUNCTION
 # ============================================================================
 
-def main():
-    """Main execution function."""
+def run_pipeline(context, dry_run=False, cancel=None, cache=None, log=print):
+    """
+    Run every stage once for a RunContext; shared by main() and the GUI.
+
+    Returns the output file, or the change set DataFrame for a dry run: that
+    run stops after planning and writes the change set to the context's
+    plan_file. It reads the workbook, the ledger, the store and the input
+    cache without write access and writes nothing else.
+    cancel: optional CancellationToken, checked between and inside stages.
+    cache: InputCache kept across runs (a new one by default).
+    log: called with every progress message.
+    """
+    cache = cache if cache is not None else InputCache()
+    if dry_run:
+        cache = cache.reader()
+    timer = StageTimer()
+    transaction_ledger = store = None
+    try:
+        log("📂 Loading data...")
+        session = WorkbookSession(context.kid_file, cache=cache, read_only=dry_run)
+        parents_df, kids_df, kids_first_rows, months, parent_name_index = load_inputs(
+            context.parent_file, context.kid_file, session=session, timer=timer,
+            debug_export=context.debug_export_file if context.debug_export and not dry_run else None
+        )
+        log("✅ Data loaded successfully.\n")
+        checkpoint(cancel)
+        print("before:" ,kids_df.head())
+        # Filter DataFrame
+        log(f"🔧 Running in {context.mode.upper()} mode...")
+        kids_df, kids_last_rows, backup_kids_df = filter_dataframe(kids_df, context.mode)
+        print(kids_df.head())
+        # Find kids of parents
+        log("\n🔍 Matching kids with parents...")
+        with timer.stage("match kids"):
+            combined_df = match_kids(parents_df, kids_df, backup_kids_df, parent_name_index, cache=cache, cancel=cancel)
+        checkpoint(cancel)
+        
+        # Get parent-kid mapping
+        log("\n📊 Creating parent-kid mapping...")
+        data_map = get_parent_kid_map(combined_df)
+        
+        # Only bookings not yet applied to this workbook are counted
+        transaction_ledger = TransactionLedger(context.ledger_path, read_only=dry_run)
+        store = PaymentStore(context.ledger_path, read_only=dry_run)
+        if dry_run and not store.is_current(session.content_hash):
+            # The sheet is scanned into a scratch store instead of the payments database
+            store.close()
+            store = PaymentStore(":memory:")
+        new_parents_df, new_fingerprints, incremental = select_new_bookings(
+            parents_df, transaction_ledger, session.content_hash
+        )
+        log(f"🧾 {len(new_fingerprints)} new bookings, {len(parents_df) - 1 - len(new_fingerprints)} already applied to this workbook.")
+        checkpoint(cancel)
+        
+        # Calculate amounts paid
+        log("\n💰 Calculating payments...")
+        ledger = build_payment_ledger(new_parents_df)
+        log(f"Aggregated {int(ledger['transfer_count'].sum())} transfers from {len(ledger)} parents.")
+        amount_map = calculate_months_paid(new_parents_df, ledger=ledger)
+        if incremental:
+            # Every family is allocated; only those with new bookings get new month cells
+            log(f"Updating {sum(parent in amount_map for parent in data_map)} of {len(data_map)} families with new bookings.")
+        
+        # Get kids status
+        log("\n📋 Getting kids status...")
+        with timer.stage("kids status"):
+            kids_status = get_all_kids_last_updates(context.kid_file, months, session=session, store=store, cancel=cancel)
+        checkpoint(cancel)
+        
+        # Calculate kid payments
+        log("\n🧮 Calculating kid payment statuses...")
+        if not dry_run:
+            store.record_families(data_map, session.content_hash)
+            store.record_fee_schedule(context.fee_schedule(kids_df['class'].dropna().unique()), session.content_hash)
+        kid_payment_status = calculate_kid_payments(
+            data_map, 
+            amount_map,
+            {row['kid_name']: {
+                'allocated_amount': 0.0,
+                'class': row['class'],
+                'monthly_fee': context.monthly_fee(row['class']),
+                'parent': row['parent_name']
+            } for _, row in kids_df.iterrows()},
+            cancel=cancel,
+            context=context
+        )
+        checkpoint(cancel)
+        
+        if dry_run:
+            with timer.stage("plan"):
+                changes = write_change_set(kids_df, kid_payment_status, kids_status, store, session.content_hash,
+                                           context.plan_file, cancel=cancel, incremental=incremental)
+            log(changes.head(20).to_string(index=False))
+            log(cache.report())
+            log(timer.report())
+            return changes
+        
+        # Update Excel file
+        log("\n" + "="*60)
+        log("UPDATING EXCEL FILE")
+        log("="*60 + "\n")
+        
+        with timer.stage("write workbook"):
+            output_file = update_excel_with_payments(
+                kids_df=kids_df,
+                kid_payment_status=kid_payment_status,
+                kids_status=kids_status,
+                months=months,
+                kid_file=context.kid_file,
+                output_file=context.output_file,
+                session=session,
+                store=store,
+                output_mode=context.output_mode,
+                cancel=cancel,
+                incremental=incremental
+            )
+        # The output is in place: the run is recorded even if it is cancelled now
+        transaction_ledger.record_run(new_parents_df.iloc[1:], new_fingerprints, session.content_hash, output_file)
+        
+        log(cache.report())
+        log(timer.report())
+        return output_file
+    finally:
+        for db in (transaction_ledger, store):
+            if db is not None:
+                db.close()
+
+
+def main(dry_run=False, context=None):
+    """
+    Main execution function.
+
+    context: RunContext of the run, default_context() when not given. A dry
+    run stops after planning, see run_pipeline.
+    """
+    context = context or default_context()
     print("="*60)
     print("PAYMENT PROCESSING SYSTEM")
     print("="*60 + "\n")
     
-    # Load data
-    print("📂 Loading data...")
-    parents_df, kids_df, kids_first_rows, months = load_data(PARENT_FILE, KID_FILE)
-    print("✅ Data loaded successfully.\n")
-    print("before:" ,kids_df.head())
-    # Filter DataFrame
-    kids_df, kids_last_rows, backup_kids_df = filter_dataframe(kids_df, MODE)
-    print(kids_df.head())
-    # Find kids of parents
-    print("\n🔍 Matching kids with parents...")
-    combined_df = find_kids_of_parents(parents_df, kids_df, backup_kids_df)
-    
-    # Get parent-kid mapping
-    print("\n📊 Creating parent-kid mapping...")
-    data_map = get_parent_kid_map(combined_df)
-    
-    # Calculate amounts paid
-    print("\n💰 Calculating payments...")
-    amount_map = calculate_months_paid(parents_df)
-    
-    # Get kids status
-    print("\n📋 Getting kids status...")
-    kids_status = get_all_kids_last_updates(KID_FILE, months)
-    
-    # Calculate kid payments
-    print("\n🧮 Calculating kid payment statuses...")
-    kid_payment_status = calculate_kid_payments(
-        data_map, 
-        amount_map,
-        {row['kid_name']: {
-            'allocated_amount': 0.0,
-            'class': row['class'],
-            'monthly_fee': get_monthly_fee_for_class(row['class']),
-            'parent': row['parent_name']
-        } for _, row in kids_df.iterrows()}
-    )
-    
-    # Update Excel file
-    print("\n" + "="*60)
-    print("UPDATING EXCEL FILE")
-    print("="*60 + "\n")
-    
-    output_file = update_excel_with_payments(
-        kids_df=kids_df,
-        kid_payment_status=kid_payment_status,
-        kids_status=kids_status,
-        months=months,
-        kid_file=KID_FILE,
-        output_file=OUTPUT_FILE
-    )
-    
-    print(f"\n🎉 Process completed! Check '{output_file}' for results.")
+    result = run_pipeline(context, dry_run=dry_run)
+    if dry_run:
+        return result
+    print(f"\n🎉 Process completed! Check '{result}' for results.")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,284 @@
+from datetime import datetime
+
+import pandas as pd
+from openpyxl.styles import Color
+
+from fill_matrix import EMPTY_COLORS, RED
+from transaction_ledger import connect_database
+
+# Workbook states kept; older ones are scanned again if they are ever read
+KEEP_WORKBOOKS = 20
+
+# Every table is keyed by the content hash of the workbook it describes, so
+# runs on different workbooks sharing a directory do not overwrite each other
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS workbooks (
+    workbook_hash TEXT PRIMARY KEY,
+    updated_at TEXT
+);
+CREATE TABLE IF NOT EXISTS sheet_kids (
+    workbook_hash TEXT NOT NULL,
+    excel_row INTEGER NOT NULL,
+    kid_id,
+    kid_name,
+    parent_name,
+    PRIMARY KEY (workbook_hash, excel_row)
+);
+CREATE INDEX IF NOT EXISTS sheet_kids_by_id ON sheet_kids (workbook_hash, kid_id);
+CREATE INDEX IF NOT EXISTS sheet_kids_by_parent ON sheet_kids (workbook_hash, parent_name);
+CREATE TABLE IF NOT EXISTS sheet_families (
+    workbook_hash TEXT NOT NULL,
+    parent_name TEXT NOT NULL,
+    kid_name TEXT NOT NULL,
+    class TEXT,
+    PRIMARY KEY (workbook_hash, parent_name, kid_name)
+);
+CREATE TABLE IF NOT EXISTS sheet_fees (
+    workbook_hash TEXT NOT NULL,
+    class TEXT NOT NULL,
+    monthly_fee REAL NOT NULL,
+    PRIMARY KEY (workbook_hash, class)
+);
+CREATE TABLE IF NOT EXISTS sheet_cells (
+    workbook_hash TEXT NOT NULL,
+    excel_row INTEGER NOT NULL,
+    month_index INTEGER NOT NULL,
+    text TEXT,
+    color TEXT,
+    is_update INTEGER NOT NULL,
+    PRIMARY KEY (workbook_hash, excel_row, month_index)
+);
+CREATE INDEX IF NOT EXISTS sheet_cells_by_month ON sheet_cells (workbook_hash, month_index);
+"""
+
+# Tables holding the state of one workbook, see PaymentStore._delete
+SHEET_TABLES = ["sheet_kids", "sheet_families", "sheet_fees", "sheet_cells"]
+
+LAST_UPDATES_QUERY = """
+SELECT k.excel_row, k.kid_id, k.kid_name, k.parent_name, m.month_index, m.text, m.color
+FROM sheet_kids k
+LEFT JOIN (
+    SELECT excel_row, MAX(month_index) AS month_index
+    FROM sheet_cells
+    WHERE workbook_hash = ? AND is_update = 1 AND month_index < ?
+    GROUP BY excel_row
+) last ON last.excel_row = k.excel_row
+LEFT JOIN sheet_cells m ON m.workbook_hash = k.workbook_hash AND m.excel_row = last.excel_row
+    AND m.month_index = last.month_index
+WHERE k.workbook_hash = ?
+ORDER BY k.excel_row
+"""
+
+
+def normalize_color(color):
+    """Colour string as openpyxl reads it back from a saved fill ('ffc000' -> '00ffc000')."""
+    return Color(rgb=color).rgb
+
+
+def is_colored(color):
+    return bool(color) and color not in EMPTY_COLORS
+
+
+def _sql_value(value):
+    """NaN cells are stored as NULL."""
+    return None if pd.isna(value) else value
+
+
+def _frame_value(value):
+    """NULL comes back as NaN, like read_excel fills empty cells."""
+    return float("nan") if value is None else value
+
+
+class PaymentStore:
+    """
+    SQLite copy of the payment state the kids sheets show, kept next to the workbooks.
+
+    Holds, per workbook, the kids, families, fee schedule and every non-empty
+    month cell (text, fill colour). A workbook is identified by its content
+    hash: the ones that were imported or rendered are stored, and when a run
+    reads one of them, status queries are answered from SQL instead of
+    scanning cell styles; any other workbook is imported first. Runs on
+    different workbooks that share the database each read their own rows.
+
+    read_only: only query the store, see connect_database.
+    """
+
+    def __init__(self, db_path, read_only=False):
+        self.db_path = db_path
+        self.conn = connect_database(db_path, SCHEMA, read_only)
+
+    def close(self):
+        self.conn.close()
+
+    def is_current(self, workbook_hash):
+        """True when the store describes the workbook with this content hash."""
+        row = self.conn.execute("SELECT 1 FROM workbooks WHERE workbook_hash = ?", (workbook_hash,)).fetchone()
+        return row is not None
+
+    def _touch(self, workbook_hash):
+        """Mark a workbook as stored now and drop the oldest beyond KEEP_WORKBOOKS."""
+        self.conn.execute(
+            "INSERT INTO workbooks (workbook_hash, updated_at) VALUES (?, ?) "
+            "ON CONFLICT (workbook_hash) DO UPDATE SET updated_at = excluded.updated_at",
+            (workbook_hash, datetime.now().isoformat(timespec="seconds")),
+        )
+        stale = self.conn.execute(
+            "SELECT workbook_hash FROM workbooks ORDER BY updated_at DESC, rowid DESC LIMIT -1 OFFSET ?",
+            (KEEP_WORKBOOKS,),
+        ).fetchall()
+        for (old_hash,) in stale:
+            self._delete(old_hash)
+            self.conn.execute("DELETE FROM workbooks WHERE workbook_hash = ?", (old_hash,))
+
+    def _delete(self, workbook_hash, tables=SHEET_TABLES):
+        for table in tables:
+            self.conn.execute(f"DELETE FROM {table} WHERE workbook_hash = ?", (workbook_hash,))
+
+    def import_sheet(self, kids, excel_rows, matrix, workbook_hash):
+        """
+        Store the state scanned from a workbook, replacing what was stored for it.
+
+        kids: DataFrame with kid_id, kid_name, parent_name, one row per entry of
+        excel_rows; matrix: FillMatrix of the month block covering those rows.
+        """
+        colored = [is_colored(color) for color in matrix.palette]
+        red = [color == RED for color in matrix.palette]
+        cells = []
+        for excel_row in excel_rows:
+            i = int(excel_row) - matrix.min_row
+            for j in range(matrix.codes.shape[1]):
+                code = matrix.codes[i, j]
+                has_value = bool(matrix.has_value[i, j])
+                if not (has_value or colored[code]):
+                    continue
+                cells.append((
+                    workbook_hash, int(excel_row), j, matrix.texts[i, j], matrix.palette[code],
+                    int((has_value or colored[code]) and not red[code])
+                ))
+
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self._delete(workbook_hash, ["sheet_kids", "sheet_cells"])
+            self.conn.executemany(
+                "INSERT INTO sheet_kids (workbook_hash, excel_row, kid_id, kid_name, parent_name) VALUES (?, ?, ?, ?, ?)",
+                (
+                    (workbook_hash, int(excel_row), _sql_value(kid_id), _sql_value(kid_name), _sql_value(parent_name))
+                    for excel_row, kid_id, kid_name, parent_name in zip(
+                        excel_rows, kids["kid_id"], kids["kid_name"], kids["parent_name"]
+                    )
+                ),
+            )
+            self.conn.executemany(
+                "INSERT INTO sheet_cells (workbook_hash, excel_row, month_index, text, color, is_update) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                cells,
+            )
+            self._touch(workbook_hash)
+
+    def last_updates(self, months, workbook_hash):
+        """
+        Same DataFrame as get_all_kids_last_updates, from the stored month cells.
+
+        None when the workbook is not stored. The kids and their cells are
+        read in one query, so a concurrent import or clean-up is never seen
+        half done.
+        """
+        rows = self.conn.execute(LAST_UPDATES_QUERY, (workbook_hash, len(months), workbook_hash)).fetchall()
+        if not rows:
+            return None
+        return pd.DataFrame({
+            "kid_id": [_frame_value(row[1]) for row in rows],
+            "kid_name": [_frame_value(row[2]) for row in rows],
+            "parent_name": [_frame_value(row[3]) for row in rows],
+            "last_month": [None if row[4] is None else months[row[4]] for row in rows],
+            "last_text": [row[5] for row in rows],
+            "last_color": [row[6] for row in rows],
+        })
+
+    def month_cells(self, excel_rows, workbook_hash):
+        """Stored (text, color) of the non-empty month cells of some rows, keyed by (excel_row, month_index)."""
+        rows = sorted({int(row) for row in excel_rows})
+        cells = {}
+        # Chunked to stay below SQLite's limit on bound parameters
+        for start in range(0, len(rows), 500):
+            chunk = rows[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            for excel_row, month_index, text, color in self.conn.execute(
+                "SELECT excel_row, month_index, text, color FROM sheet_cells "
+                f"WHERE workbook_hash = ? AND excel_row IN ({placeholders})", [workbook_hash, *chunk]
+            ):
+                cells[excel_row, month_index] = (text, color)
+        return cells
+
+    def record_families(self, data_map, workbook_hash):
+        """Store the parent -> {kid: class} mapping of a workbook."""
+        with self.conn:
+            self._delete(workbook_hash, ["sheet_families"])
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO sheet_families (workbook_hash, parent_name, kid_name, class) VALUES (?, ?, ?, ?)",
+                (
+                    (workbook_hash, str(parent), str(kid_name), _sql_value(class_name))
+                    for parent, kids in data_map.items()
+                    for kid_name, class_name in kids.items()
+                ),
+            )
+
+    def record_fee_schedule(self, fees, workbook_hash):
+        """Store the monthly fee used for each class of a workbook."""
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO sheet_fees (workbook_hash, class, monthly_fee) VALUES (?, ?, ?) "
+                "ON CONFLICT (workbook_hash, class) DO UPDATE SET monthly_fee = excluded.monthly_fee",
+                ((workbook_hash, str(class_name), float(fee)) for class_name, fee in fees.items()),
+            )
+
+    def record_render(self, month_cells, input_hash, output_hash):
+        """
+        Store the workbook just rendered: the input's state with the month cells applied.
+
+        month_cells: (excel_row, month_index, value, color, copy_format) tuples
+        as produced by plan_month_cells; value None keeps the cell's text.
+        Nothing is stored when the input workbook is not (e.g. it was dropped
+        meanwhile): the output is then scanned when it is next read.
+        """
+        written, recolored = [], []
+        for excel_row, month_index, value, color, _ in month_cells:
+            color = normalize_color(color)
+            if value is None:
+                recolored.append((output_hash, excel_row, month_index, color, int(is_colored(color) and color != RED)))
+            else:
+                text = (str(value).strip() if value else "") or None
+                is_update = (text is not None or is_colored(color)) and color != RED
+                written.append((output_hash, excel_row, month_index, text, color, int(is_update)))
+
+        with self.conn:
+            # Write lock first, so the input cannot be dropped between the check and the copy
+            self.conn.execute("BEGIN IMMEDIATE")
+            if not self.is_current(input_hash):
+                return
+            if output_hash != input_hash:
+                self._delete(output_hash, ["sheet_kids", "sheet_cells"])
+                for table, columns in [
+                    ("sheet_kids", "excel_row, kid_id, kid_name, parent_name"),
+                    ("sheet_cells", "excel_row, month_index, text, color, is_update"),
+                ]:
+                    self.conn.execute(
+                        f"INSERT INTO {table} (workbook_hash, {columns}) "
+                        f"SELECT ?, {columns} FROM {table} WHERE workbook_hash = ?",
+                        (output_hash, input_hash),
+                    )
+            self.conn.executemany(
+                "INSERT INTO sheet_cells (workbook_hash, excel_row, month_index, text, color, is_update) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (workbook_hash, excel_row, month_index) DO UPDATE SET "
+                "text = excluded.text, color = excluded.color, is_update = excluded.is_update",
+                written,
+            )
+            self.conn.executemany(
+                "INSERT INTO sheet_cells (workbook_hash, excel_row, month_index, text, color, is_update) "
+                "VALUES (?, ?, ?, NULL, ?, ?) "
+                "ON CONFLICT (workbook_hash, excel_row, month_index) DO UPDATE SET "
+                "color = excluded.color, is_update = excluded.is_update",
+                recolored,
+            )
+            self._touch(output_hash)
@@ -0,0 +1,68 @@
+import os
+from dataclasses import dataclass, replace
+
+from transaction_ledger import ledger_path
+
+# Kids sheet before filtering, exported next to the output file and named after it
+DEBUG_EXPORT_SUFFIX = "_kids_before_filtering.xlsx"
+
+
+@dataclass(frozen=True)
+class RunContext:
+    """
+    Settings of one pipeline run: files, mode and fee set.
+
+    Built once per run (see payment_processor.default_context) and passed to
+    the stages that need it instead of setting module globals, so runs for
+    different schools or fee sets can execute side by side in one process.
+    """
+    parent_file: str
+    kid_file: str
+    output_file: str
+    mode: str
+    monthly_fee_a: float
+    monthly_fee_b: float
+    a_classes: tuple
+    b_classes: tuple
+    output_mode: str
+    plan_file: str
+    debug_export: bool = True  # export the kids sheet before filtering to debug_export_file
+    ledger_file: str = None  # payments database, see ledger_path
+
+    def __post_init__(self):
+        # Lists given by callers are frozen too
+        object.__setattr__(self, "a_classes", tuple(self.a_classes))
+        object.__setattr__(self, "b_classes", tuple(self.b_classes))
+
+    @property
+    def debug_export_file(self):
+        """Kids sheet export of this run: '<output>_kids_before_filtering.xlsx'."""
+        return os.path.splitext(self.output_file)[0] + DEBUG_EXPORT_SUFFIX
+
+    @property
+    def ledger_path(self):
+        """
+        Payments database (ledger and payment store) of this run.
+
+        ledger_file when set, else the one next to the output workbook: the
+        run that later reads this output finds its lineage there as long as
+        it writes to the same directory. Set ledger_file to share one
+        database between runs writing to different directories.
+        """
+        return self.ledger_file or ledger_path(self.output_file)
+
+    def monthly_fee(self, class_name):
+        """Monthly fee of a class: group A, then group B, group A for unknown classes."""
+        if class_name in self.a_classes:
+            return self.monthly_fee_a
+        if class_name in self.b_classes:
+            return self.monthly_fee_b
+        return self.monthly_fee_a
+
+    def fee_schedule(self, class_names):
+        """{class: monthly fee} for the given classes."""
+        return {class_name: self.monthly_fee(class_name) for class_name in class_names}
+
+    def updated(self, **changes):
+        """Copy of the context with some settings changed."""
+        return replace(self, **changes)
@@ -0,0 +1,55 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+class StageTimer:
+    """
+    Wall-clock timeline of pipeline stages, safe to use from several threads.
+
+    Each stage records its start and end relative to the timer's creation and
+    the thread it ran on, so stages that overlapped show up side by side in
+    the report.
+    """
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.stages = []
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter() - self.origin
+        try:
+            yield
+        finally:
+            end = time.perf_counter() - self.origin
+            with self.lock:
+                self.stages.append((name, start, end, threading.current_thread().name))
+
+    def timed(self, name, func, *args, **kwargs):
+        """Call func inside a stage; handy for executor.submit."""
+        with self.stage(name):
+            return func(*args, **kwargs)
+
+    def report(self):
+        """Multi-line timeline, stages in start order, with the time saved by overlapping."""
+        with self.lock:
+            stages = sorted(self.stages, key=lambda stage: stage[1])
+        if not stages:
+            return "⏱️ No stages timed."
+        width = max(len(name) for name, *_ in stages)
+        lines = ["⏱️ Stage timings:"]
+        for name, start, end, thread in stages:
+            lines.append(f"   {name:<{width}}  {start:7.2f}s → {end:7.2f}s  ({end - start:6.2f}s)  [{thread}]")
+
+        # Time covered by at least one stage, to tell overlap apart from idle gaps
+        busy = sum(end - start for _, start, end, _ in stages)
+        covered, covered_until = 0.0, float("-inf")
+        for _, start, end, _ in stages:
+            if end > covered_until:
+                covered += end - max(start, covered_until)
+                covered_until = end
+        if busy - covered > 0.005:
+            lines.append(f"   {busy:.2f}s of stage work ran in {covered:.2f}s ({busy - covered:.2f}s overlapped)")
+        return "\n".join(lines)
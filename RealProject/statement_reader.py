@@ -0,0 +1,147 @@
+import codecs
+from functools import cache
+
+import pandas as pd
+
+from amount_parser import parse_amounts
+
+# Column titles of a German bank CSV export (Sparkasse CSV-CAMT layout)
+STATEMENT_COLUMNS = [
+    "Auftragskonto", "Buchungstag", "Valutadatum", "Buchungstext",
+    "Verwendungszweck", "Beguenstigter/Zahlungspflichtiger", "Kontonummer/IBAN",
+    "BIC (SWIFT-Code)", "Betrag", "Waehrung", "Info"
+]
+
+# Statement column -> pipeline column, for the columns the pipeline uses
+PIPELINE_COLUMNS = {
+    "Buchungstag": "Booking_Date",
+    "Verwendungszweck": "Usage_Purpose",
+    "Beguenstigter/Zahlungspflichtiger": "parent_name",
+    "Kontonummer/IBAN": "Account_or_IBAN",
+    "Betrag": "Amount",
+}
+
+# Columns only used to fingerprint bookings; exports without them still load
+OPTIONAL_COLUMNS = {"Verwendungszweck", "Kontonummer/IBAN"}
+
+# Spellings of the used columns found in exports of other banks / versions
+COLUMN_ALIASES = {
+    "buchungstag": "Buchungstag",
+    "buchungsdatum": "Buchungstag",
+    "beguenstigter/zahlungspflichtiger": "Beguenstigter/Zahlungspflichtiger",
+    "begünstigter/zahlungspflichtiger": "Beguenstigter/Zahlungspflichtiger",
+    "name zahlungsbeteiligter": "Beguenstigter/Zahlungspflichtiger",
+    "verwendungszweck": "Verwendungszweck",
+    "kontonummer/iban": "Kontonummer/IBAN",
+    "kontonummer": "Kontonummer/IBAN",
+    "iban": "Kontonummer/IBAN",
+    "iban zahlungsbeteiligter": "Kontonummer/IBAN",
+    "betrag": "Betrag",
+    "betrag (€)": "Betrag",
+}
+
+CHUNK_SIZE = 5000
+SAMPLE_SIZE = 64 * 1024
+
+# Decode error handler for bytes past the sample that are not UTF-8
+LATIN1_FALLBACK = "latin-1-fallback"
+
+
+def decode_as_latin1(error):
+    """Read the bytes UTF-8 cannot decode as Latin-1 instead of failing mid-file."""
+    return error.object[error.start:error.end].decode("latin-1"), error.end
+
+
+@cache
+def latin1_fallback():
+    """Name of the LATIN1_FALLBACK error handler, registered the first time a statement is read."""
+    codecs.register_error(LATIN1_FALLBACK, decode_as_latin1)
+    return LATIN1_FALLBACK
+
+
+def detect_encoding(file_path, sample_size=SAMPLE_SIZE):
+    """
+    'utf-8-sig' if the start of the file decodes as UTF-8, else 'latin-1'.
+
+    Only the start is sampled: read the file with errors=latin1_fallback() so a
+    Latin-1 character further down does not stop a UTF-8 read.
+    """
+    with open(file_path, "rb") as f:
+        sample = f.read(sample_size)
+    try:
+        # Not final: a multi-byte character may be cut at the end of the sample
+        codecs.getincrementaldecoder("utf-8-sig")().decode(sample, final=False)
+    except UnicodeDecodeError:
+        return "latin-1"
+    return "utf-8-sig"
+
+
+def read_header(file_path, encoding=None):
+    """Column titles of a statement CSV."""
+    encoding = encoding or detect_encoding(file_path)
+    with open(file_path, encoding=encoding, errors=latin1_fallback(), newline="") as f:
+        first_line = f.readline()
+    return [title.strip().strip('"') for title in first_line.rstrip("\r\n").split(";")]
+
+
+def is_statement_csv(file_path):
+    """Check whether a CSV file is a ';'-separated bank statement export."""
+    titles = read_header(file_path)
+    found = {COLUMN_ALIASES.get(title.lower()) for title in titles}
+    return set(PIPELINE_COLUMNS) - OPTIONAL_COLUMNS <= found
+
+
+def parse_booking_dates(values):
+    """Parse 'dd.mm.yy' dates, falling back to 'dd.mm.yyyy'; unparsable values become NaT."""
+    dates = pd.to_datetime(values, format="%d.%m.%y", errors="coerce")
+    missing = dates.isna() & values.notna()
+    if missing.any():
+        dates[missing] = pd.to_datetime(values[missing], format="%d.%m.%Y", errors="coerce")
+    return dates
+
+
+def iter_statement_chunks(file_path, chunksize=CHUNK_SIZE, source=None):
+    """
+    Yield a bank statement CSV as DataFrames of at most `chunksize` bookings.
+
+    The bookings are read from `source`, an open binary handle on file_path,
+    when given (e.g. one that tracks how far the file has been read).
+
+    Only the columns in PIPELINE_COLUMNS are read, with declared dtypes, and
+    renamed to the pipeline names: Booking_Date (datetime64), Usage_Purpose,
+    parent_name, Account_or_IBAN (str) and Amount (float, read by
+    amount_parser.parse_amounts with a decimal comma; unreadable amounts are
+    NaN). Missing optional columns are left empty.
+    """
+    encoding = detect_encoding(file_path)
+    titles = read_header(file_path, encoding)
+    wanted = {}
+    for title in titles:
+        column = COLUMN_ALIASES.get(title.lower())
+        if column in PIPELINE_COLUMNS and column not in wanted.values():
+            wanted[title] = column
+    missing = set(PIPELINE_COLUMNS) - OPTIONAL_COLUMNS - set(wanted.values())
+    if missing:
+        raise ValueError(f"Statement {file_path} has no column(s): {', '.join(sorted(missing))}")
+
+    reader = pd.read_csv(
+        file_path if source is None else source,
+        sep=";",
+        encoding=encoding,
+        encoding_errors=latin1_fallback(),
+        usecols=list(wanted),
+        dtype={title: "str" for title in wanted},
+        chunksize=chunksize,
+    )
+    for chunk in reader:
+        chunk = chunk.rename(columns={title: PIPELINE_COLUMNS[column] for title, column in wanted.items()})
+        amounts, _ = parse_amounts(chunk["Amount"], decimal=",")
+        empty = pd.Series(None, index=chunk.index, dtype="str")
+        yield pd.DataFrame({
+            "Booking_Date": parse_booking_dates(chunk["Booking_Date"].str.strip()),
+            "Usage_Purpose": chunk.get("Usage_Purpose", empty),
+            "parent_name": chunk["parent_name"],
+            "Account_or_IBAN": chunk.get("Account_or_IBAN", empty),
+            "Amount": amounts,
+        }, index=chunk.index)
+
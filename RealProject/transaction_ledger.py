@@ -0,0 +1,192 @@
+import hashlib
+import os
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+LEDGER_FILE = "payments.sqlite"
+
+# Changes to the tables of an existing payments database, each applied once
+# and in order; PRAGMA user_version counts the ones applied
+MIGRATIONS = [
+    # 1: the payment store keys its tables by workbook, see payment_store.SCHEMA
+    [
+        "DROP TABLE IF EXISTS store_state",
+        "DROP TABLE IF EXISTS kids",
+        "DROP TABLE IF EXISTS families",
+        "DROP TABLE IF EXISTS fee_schedule",
+        "DROP TABLE IF EXISTS month_cells",
+    ],
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    input_hash TEXT NOT NULL,
+    output_hash TEXT NOT NULL,
+    output_file TEXT,
+    applied_at TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_by_output ON runs (output_hash);
+CREATE TABLE IF NOT EXISTS applied (
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    fingerprint TEXT NOT NULL,
+    parent_name TEXT,
+    booking_date TEXT,
+    amount REAL,
+    PRIMARY KEY (run_id, fingerprint)
+);
+"""
+
+
+def file_hash(file_path):
+    """SHA-256 of a file's content."""
+    with open(file_path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def ledger_path(workbook_file):
+    """Payments database (ledger and payment store) next to a workbook."""
+    return os.path.join(os.path.dirname(os.path.abspath(workbook_file)), LEDGER_FILE)
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """Apply the MIGRATIONS the database has not had yet."""
+    if schema_version(conn) >= len(MIGRATIONS):
+        return
+    with conn:
+        # Write lock first, so two runs opening the file cannot both migrate it
+        conn.execute("BEGIN IMMEDIATE")
+        version = schema_version(conn)
+        for statements in MIGRATIONS[version:]:
+            for statement in statements:
+                conn.execute(statement)
+        conn.execute(f"PRAGMA user_version = {len(MIGRATIONS)}")
+
+
+def connect_database(db_path, schema, read_only=False):
+    """
+    SQLite connection to db_path, migrated and with the tables of `schema` in place.
+
+    read_only opens the file without write access, so SQLite refuses any
+    write; a file that does not exist yet or lacks the schema's tables is
+    replaced by an empty in-memory database.
+    """
+    if read_only:
+        if os.path.exists(db_path):
+            conn = sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True)
+            try:
+                # Also before migrating: the migrations only drop tables no schema uses any more
+                conn.executescript(schema)
+                return conn
+            except sqlite3.OperationalError:
+                conn.close()
+        db_path = ":memory:"
+    conn = sqlite3.connect(db_path)
+    migrate(conn)
+    conn.executescript(schema)
+    return conn
+
+
+def booking_fingerprints(bookings):
+    """
+    Stable fingerprint per booking from Account_or_IBAN, Booking_Date, Amount and Usage_Purpose.
+
+    Identical bookings in one statement (same payer, day, amount and purpose)
+    are numbered in order, so a year-to-date export fingerprints its old rows
+    the same way every month.
+    """
+    iban = bookings["Account_or_IBAN"].fillna("").astype(str).str.replace(r"\s", "", regex=True).str.upper()
+    dates = pd.to_datetime(bookings["Booking_Date"], errors="coerce", dayfirst=True).dt.strftime("%Y-%m-%d").fillna("")
+    amounts = pd.to_numeric(bookings["Amount"], errors="coerce").map("{:.2f}".format)
+    purpose = bookings["Usage_Purpose"].fillna("").astype(str).str.strip()
+
+    keys = iban + "|" + dates + "|" + amounts + "|" + purpose
+    occurrence = keys.groupby(keys).cumcount().astype(str)
+    return pd.Series(
+        [hashlib.sha1(f"{key}|{n}".encode("utf-8")).hexdigest() for key, n in zip(keys, occurrence)],
+        index=bookings.index,
+    )
+
+
+class TransactionLedger:
+    """
+    SQLite record of the bank bookings already applied to a kids workbook.
+
+    Every run stores the content hash of the workbook it read and of the one
+    it wrote. The bookings applied to a workbook are those of the runs that
+    produced it, followed back through their inputs, so feeding an updated
+    workbook back in skips its bookings while starting again from the original
+    sheet applies everything.
+
+    read_only: only look bookings up, see connect_database.
+    """
+
+    def __init__(self, db_path, read_only=False):
+        self.db_path = db_path
+        self.conn = connect_database(db_path, SCHEMA, read_only)
+
+    def close(self):
+        self.conn.close()
+
+    def lineage(self, workbook_hash):
+        """
+        Ids of the runs whose output led to this workbook, newest first.
+
+        Runs that left the workbook byte-identical (nothing new to write) are
+        included and do not end the walk; the chain continues through the
+        newest run that produced the workbook from a different one.
+        """
+        run_ids = []
+        seen = set()
+        current = workbook_hash
+        while current not in seen:
+            seen.add(current)
+            rows = self.conn.execute(
+                "SELECT id, input_hash FROM runs WHERE output_hash = ? ORDER BY id DESC", (current,)
+            ).fetchall()
+            previous = None
+            for run_id, input_hash in rows:
+                if input_hash == current:
+                    run_ids.append(run_id)
+                elif previous is None:
+                    run_ids.append(run_id)
+                    previous = input_hash
+            if previous is None:
+                break
+            current = previous
+        return run_ids
+
+    def applied_fingerprints(self, run_ids):
+        """Fingerprints of the bookings applied by the given runs."""
+        if not run_ids:
+            return set()
+        placeholders = ",".join("?" * len(run_ids))
+        rows = self.conn.execute(f"SELECT fingerprint FROM applied WHERE run_id IN ({placeholders})", run_ids)
+        return {fingerprint for (fingerprint,) in rows}
+
+    def record_run(self, bookings, fingerprints, input_hash, output_file):
+        """Store a finished run and the bookings it applied; returns the run id."""
+        with self.conn:
+            cursor = self.conn.execute(
+                "INSERT INTO runs (input_hash, output_hash, output_file, applied_at) VALUES (?, ?, ?, ?)",
+                (input_hash, file_hash(output_file), os.path.abspath(output_file), datetime.now().isoformat(timespec="seconds")),
+            )
+            run_id = cursor.lastrowid
+            dates = pd.to_datetime(bookings["Booking_Date"], errors="coerce", dayfirst=True).dt.strftime("%Y-%m-%d")
+            amounts = pd.to_numeric(bookings["Amount"], errors="coerce")
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO applied (run_id, fingerprint, parent_name, booking_date, amount) VALUES (?, ?, ?, ?, ?)",
+                (
+                    (run_id, fingerprint, None if pd.isna(parent) else str(parent),
+                     None if pd.isna(date) else date, None if pd.isna(amount) else float(amount))
+                    for fingerprint, parent, date, amount in zip(fingerprints, bookings["parent_name"], dates, amounts)
+                ),
+            )
+        return run_id
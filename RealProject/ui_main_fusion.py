@@ -4,7 +4,7 @@ from datetime import datetime
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QPushButton, QLabel, QLineEdit, QTextEdit, QFileDialog,
-    QGroupBox, QComboBox, QProgressBar, QMessageBox, QSpinBox
+    QGroupBox, QComboBox, QProgressBar, QMessageBox, QSpinBox, QCheckBox
 )
 from PyQt6.QtCore import QThread, pyqtSignal, Qt
 from PyQt6.QtGui import QFont, QIcon
@@ -18,75 +18,48 @@ class ProcessingThread(QThread):
     progress = pyqtSignal(str)
     finished = pyqtSignal(bool, str)
     
-    def __init__(self, parent_file, kid_file, output_file, mode, monthly_fee_a, monthly_fee_b , a_classes, b_classes):
+    def __init__(self, parent_file, kid_file, output_file, mode, monthly_fee_a, monthly_fee_b , a_classes, b_classes, input_cache=None,
+                 dry_run=False):
         super().__init__()
-        self.parent_file = parent_file
-        self.kid_file = kid_file
-        self.output_file = output_file
-        self.mode = mode
-        self.monthly_fee_a = monthly_fee_a
-        self.monthly_fee_b = monthly_fee_b
-        self.a_classes = a_classes
-        self.b_classes = b_classes
+        # Settings of this run only; processor's module settings are left alone.
+        # A dry run writes its change set next to the output a real run would write.
+        self.context = processor.default_context(
+            parent_file=parent_file,
+            kid_file=kid_file,
+            output_file=output_file,
+            mode=mode,
+            monthly_fee_a=monthly_fee_a,
+            monthly_fee_b=monthly_fee_b,
+            a_classes=a_classes,
+            b_classes=b_classes,
+            plan_file=os.path.splitext(output_file)[0] + "_plan.csv",
+        )
+        self.input_cache = input_cache
+        self.dry_run = dry_run
+        self.cancel_token = processor.CancellationToken()
+    
+    def cancel(self):
+        """Ask the run to stop at its next checkpoint."""
+        self.cancel_token.cancel()
     
     def run(self):
         """Run the payment processing."""
         try:
-            # Update processor constants
-            processor.PARENT_FILE = self.parent_file
-            processor.KID_FILE = self.kid_file
-            processor.OUTPUT_FILE = self.output_file
-            processor.MODE = self.mode
-            processor.MONTHLY_FEE_A = self.monthly_fee_a
-            processor.MONTHLY_FEE_B = self.monthly_fee_b
-            
-            self.progress.emit("📂 Loading data...")
-            parents_df, kids_df, kids_first_rows, months = processor.load_data(
-                self.parent_file, self.kid_file
-            )
-            self.progress.emit("✅ Data loaded successfully.")
-            
-            self.progress.emit(f"\n🔧 Running in {self.mode.upper()} mode...")
-            kids_df, kids_last_rows, backup_kids_df = processor.filter_dataframe(kids_df, self.mode)
-            
-            self.progress.emit("\n🔍 Matching kids with parents...")
-            combined_df = processor.find_kids_of_parents(parents_df, kids_df, backup_kids_df)
-            
-            self.progress.emit("\n📊 Creating parent-kid mapping...")
-            data_map = processor.get_parent_kid_map(combined_df)
-            
-            self.progress.emit("\n💰 Calculating payments...")
-            amount_map = processor.calculate_months_paid(parents_df)
-            
-            self.progress.emit("\n📋 Getting kids status...")
-            kids_status = processor.get_all_kids_last_updates(self.kid_file, months)
-            
-            self.progress.emit("\n🧮 Calculating kid payment statuses...")
-            kid_payment_status = processor.calculate_kid_payments(
-                data_map,
-                amount_map,
-                {row['kid_name']: {
-                    'allocated_amount': 0.0,
-                    'class': row['class'],
-                    'monthly_fee': processor.get_monthly_fee_for_class(row['class']),
-                    'parent': row['parent_name']
-                } for _, row in kids_df.iterrows()}
+            result = processor.run_pipeline(
+                self.context, dry_run=self.dry_run, cancel=self.cancel_token,
+                cache=self.input_cache, log=self.progress.emit
             )
-            
-            self.progress.emit("\n📝 Updating Excel file...")
-            output = processor.update_excel_with_payments(
-                kids_df=kids_df,
-                kid_payment_status=kid_payment_status,
-                kids_status=kids_status,
-                months=months,
-                kid_file=self.kid_file,
-                output_file=self.output_file
-            )
-            
+            if self.dry_run:
+                self.progress.emit(f"\n📝 Dry run: {len(result)} cell changes for {result['kid_name'].nunique()} kids.")
+                self.finished.emit(True, self.context.plan_file)
+                return
             self.progress.emit(f"\n✅ Process completed successfully!")
-            self.progress.emit(f"📄 Output saved to: {output}")
-            self.finished.emit(True, output)
+            self.progress.emit(f"📄 Output saved to: {result}")
+            self.finished.emit(True, result)
             
+        except processor.Cancelled:
+            self.progress.emit("\n⚠️ Processing stopped by user.")
+            self.finished.emit(False, "Stopped by user")
         except Exception as e:
             error_msg = f"❌ Error: {str(e)}"
             self.progress.emit(f"\n{error_msg}")
@@ -99,6 +72,8 @@ class PaymentProcessorGUI(QMainWindow):
     def __init__(self):
         super().__init__()
         self.processing_thread = None
+        # Kept across runs so re-running with other fees skips re-parsing the inputs
+        self.input_cache = processor.InputCache()
         self.init_ui()
     
     def init_ui(self):
@@ -222,7 +197,7 @@ class PaymentProcessorGUI(QMainWindow):
         parent_label.setMinimumWidth(150)
         self.parent_file_input = QLineEdit("parents_payments.xlsx")
         parent_browse_btn = QPushButton("Browse...")
-        parent_browse_btn.clicked.connect(lambda: self.browse_file(self.parent_file_input, "Excel Files (*.xlsx *.xls)"))
+        parent_browse_btn.clicked.connect(lambda: self.browse_file(self.parent_file_input, "Statement Files (*.xlsx *.xls *.csv)"))
         
         parent_layout.addWidget(parent_label)
         parent_layout.addWidget(self.parent_file_input)
@@ -252,9 +227,9 @@ class PaymentProcessorGUI(QMainWindow):
 
         # A-group input
         a_layout = QHBoxLayout()
-        a_label = QLabel("Classes (A5–A12):")
+        a_label = QLabel("Classes (A5–A12, G2):")
         a_label.setMinimumWidth(150)
-        self.a_classes_input = QLineEdit("A5,A6,A7,A8,A9,A10,A11,A12")
+        self.a_classes_input = QLineEdit("A5,A6,A7,A8,A9,A10,A11,A12,G2")
         a_layout.addWidget(a_label)
         a_layout.addWidget(self.a_classes_input)
         layout.addLayout(a_layout)
@@ -288,6 +263,11 @@ class PaymentProcessorGUI(QMainWindow):
         mode_layout.addStretch()
         layout.addLayout(mode_layout)
 
+        # Dry run: only the change set is written
+        self.dry_run_checkbox = QCheckBox("Plan only (dry run, no workbook saved)")
+        self.dry_run_checkbox.setToolTip("Writes the cell changes the run would make to <output>_plan.csv.")
+        layout.addWidget(self.dry_run_checkbox)
+
         # Monthly fees with explicit class lists
         fee_a_label = QLabel("Monthly Fee – Group A (A5–A12, G2):")
         fee_a_label.setMinimumWidth(180)
@@ -403,19 +383,20 @@ class PaymentProcessorGUI(QMainWindow):
         
         # Start processing thread
         self.processing_thread = ProcessingThread(
-            parent_file, kids_file, output_file, mode, monthly_fee_a, monthly_fee_b , a_classes, b_classes 
+            parent_file, kids_file, output_file, mode, monthly_fee_a, monthly_fee_b , a_classes, b_classes,
+            input_cache=self.input_cache,
+            dry_run=self.dry_run_checkbox.isChecked()
         )
         self.processing_thread.progress.connect(self.update_log)
         self.processing_thread.finished.connect(self.processing_finished)
         self.processing_thread.start()
     
     def stop_processing(self):
-        """Stop the processing thread."""
+        """Ask the processing thread to stop; it finishes through processing_finished."""
         if self.processing_thread and self.processing_thread.isRunning():
-            self.processing_thread.terminate()
-            self.processing_thread.wait()
-            self.update_log("\n⚠️ Processing stopped by user.")
-            self.processing_finished(False, "Stopped by user")
+            self.processing_thread.cancel()
+            self.stop_btn.setEnabled(False)
+            self.statusBar().showMessage("Stopping...")
     
     def update_log(self, message):
         """Update the log output."""
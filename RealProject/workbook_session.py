@@ -0,0 +1,128 @@
+import hashlib
+import re
+import zipfile
+from io import BytesIO
+
+import pandas as pd
+from openpyxl import load_workbook
+
+from fill_matrix import extract_fill_matrix
+from input_cache import file_key
+
+# Matches <f>, <f t="shared" .../> and friends inside worksheet XML
+FORMULA_TAG = re.compile(rb"<f[\s>/]")
+
+
+def workbook_has_formulas(data):
+    """Check raw xlsx bytes for formula cells in any worksheet."""
+    with zipfile.ZipFile(BytesIO(data)) as archive:
+        for name in archive.namelist():
+            if name.startswith("xl/worksheets/") and name.endswith(".xml"):
+                if FORMULA_TAG.search(archive.read(name)):
+                    return True
+    return False
+
+
+class WorkbookSession:
+    """
+    Kids workbook opened once and shared by every processing stage.
+
+    The file is read from disk a single time. Stages that only read (DataFrame
+    view, cell values, fills) use `values_sheet`, which holds cached formula
+    results like `pd.read_excel` does. `workbook` / `sheet` are the mutable
+    view used for writing; it is the same parsed workbook unless the file
+    contains formulas, in which case it is parsed lazily (formulas must be
+    kept on save).
+
+    With an InputCache, DataFrames, fill matrices and sheet facts of an
+    unchanged file come from the cache and the XML is only parsed when a
+    stage needs the workbook itself (e.g. for writing).
+
+    A read_only session (plan mode) parses the file with openpyxl's read-only
+    reader and has no write-capable workbook.
+    """
+
+    def __init__(self, file_path, cache=None, read_only=False):
+        self.file_path = file_path
+        self.read_only = read_only
+        with open(file_path, "rb") as f:
+            self._data = f.read()
+        self.content_hash = hashlib.sha256(self._data).hexdigest()
+        self.cache = cache
+        self.key = file_key(file_path, self._data) if cache is not None else None
+        self._facts = (cache.facts(self.key) if cache is not None else None) or {}
+        if "has_formulas" not in self._facts:
+            self._facts["has_formulas"] = workbook_has_formulas(self._data)
+        self.has_formulas = self._facts["has_formulas"]
+        self._values_workbook = None
+        self._workbook = None
+        self._frames = {}
+
+    @property
+    def data(self):
+        """Raw bytes of the xlsx file."""
+        return self._data
+
+    @property
+    def values_workbook(self):
+        """Workbook with cached formula results, parsed on first use."""
+        if self._values_workbook is None:
+            self._values_workbook = load_workbook(BytesIO(self._data), data_only=True, read_only=self.read_only)
+        return self._values_workbook
+
+    @property
+    def values_sheet(self):
+        """Active sheet with cached values (read-only use)."""
+        return self.values_workbook.active
+
+    @property
+    def workbook(self):
+        """Write-capable workbook, formulas preserved."""
+        if self.read_only:
+            raise ValueError(f"{self.file_path} was opened read-only")
+        if self._workbook is None:
+            if self.has_formulas:
+                self._workbook = load_workbook(BytesIO(self._data))
+            else:
+                self._workbook = self.values_workbook
+        return self._workbook
+
+    @property
+    def sheet(self):
+        """Active sheet of the write-capable workbook."""
+        return self.workbook.active
+
+    @property
+    def max_column(self):
+        if "max_column" not in self._facts:
+            self._facts["max_column"] = self.values_sheet.max_column
+            if self.cache is not None:
+                self.cache.store_facts(self.key, self._facts)
+        return self._facts["max_column"]
+
+    def frame(self, header=None):
+        """DataFrame of the first sheet, same as `pd.read_excel(kid_file, header=header)`."""
+        if header not in self._frames:
+            # pandas closes a read-only workbook it was given, so it reads its own from the bytes
+            source = BytesIO(self._data) if self.read_only else self.values_workbook
+            build = lambda: pd.read_excel(source, header=header, engine="openpyxl")
+            if self.cache is not None:
+                self._frames[header] = self.cache.frame(self.key, f"frame_h{header}.arrow", build)
+            else:
+                self._frames[header] = build()
+        return self._frames[header].copy()
+
+    def fill_matrix(self, min_row, max_row, min_col, max_col, cancel=None):
+        """FillMatrix of a block of the values sheet, see extract_fill_matrix."""
+        build = lambda: extract_fill_matrix(self.values_sheet, min_row, max_row, min_col, max_col, cancel=cancel)
+        if self.cache is None:
+            return build()
+        return self.cache.matrix(self.key, f"fills_{min_row}_{max_row}_{min_col}_{max_col}.arrow", build)
+
+    def value(self, row, column):
+        """Cached value of a cell (1-based indices)."""
+        return self.values_sheet.cell(row=row, column=column).value
+
+    def fill(self, row, column):
+        """PatternFill of a cell (1-based indices)."""
+        return self.values_sheet.cell(row=row, column=column).fill
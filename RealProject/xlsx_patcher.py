@@ -0,0 +1,321 @@
+import numbers
+import posixpath
+import re
+import zipfile
+from io import BytesIO
+from xml.etree import ElementTree as ET
+from xml.sax.saxutils import escape
+
+from openpyxl.styles import Color
+from openpyxl.utils import column_index_from_string, get_column_letter
+
+MAIN_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+PACKAGE_REL_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+SHEET_DATA = re.compile(rb"<sheetData\s*/>|<sheetData>(.*?)</sheetData>", re.S)
+ROW = re.compile(rb"<row\b[^>]*?(?:/>|>.*?</row>)", re.S)
+ROW_HEAD = re.compile(rb"<row\b[^>]*?(/?)>")
+CELL = re.compile(rb"<c\b[^>]*?(?:/>|>.*?</c>)", re.S)
+CELL_HEAD = re.compile(rb"<c\b[^>]*?(/?)>")
+ROW_NUMBER = re.compile(rb'\sr="(\d+)"')
+CELL_REF = re.compile(rb'\sr="([A-Z]+)(\d+)"')
+STYLE_ATTR = re.compile(rb'\ss="(\d+)"')
+SPANS_ATTR = re.compile(rb'\sspans="[^"]*"')
+FORMULA = re.compile(rb"<f[\s>/]")
+
+FILLS = re.compile(r'<fills count="\d+"\s*>(.*?)</fills>', re.S)
+CELL_XFS = re.compile(r'<cellXfs count="\d+"\s*>(.*?)</cellXfs>', re.S)
+FILL = re.compile(r"<fill\b[^>]*?(?:/>|>.*?</fill>)", re.S)
+XF = re.compile(r"<xf\b[^>]*?(?:/>|>.*?</xf>)", re.S)
+
+# xf attributes and children that copy_cell_format takes from the reference cell
+FORMAT_ATTRIBUTES = (
+    "numFmtId", "fontId", "borderId",
+    "applyNumberFormat", "applyFont", "applyBorder", "applyAlignment", "applyProtection",
+)
+FORMAT_CHILDREN = ("alignment", "protection")
+
+
+class PatchUnsupported(Exception):
+    """The workbook cannot be patched in place and has to be saved with openpyxl."""
+
+
+def _part_path(base, target):
+    """Zip member name of a relationship target."""
+    if target.startswith("/"):
+        return target[1:]
+    return posixpath.normpath(posixpath.join(posixpath.dirname(base), target))
+
+
+def workbook_parts(archive):
+    """Zip member names of the active worksheet and the stylesheet."""
+    workbook = ET.fromstring(archive.read("xl/workbook.xml"))
+    rels = ET.fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+    targets = {rel.get("Id"): rel.get("Target") for rel in rels.iter(f"{PACKAGE_REL_NS}Relationship")}
+
+    view = workbook.find(f"{MAIN_NS}bookViews/{MAIN_NS}workbookView")
+    active = int(view.get("activeTab", 0)) if view is not None else 0
+    sheets = workbook.findall(f"{MAIN_NS}sheets/{MAIN_NS}sheet")
+    if not sheets or active >= len(sheets):
+        raise PatchUnsupported("no active worksheet")
+    sheet_path = _part_path("xl/workbook.xml", targets[sheets[active].get(f"{REL_NS}id")])
+
+    styles = [rel.get("Target") for rel in rels.iter(f"{PACKAGE_REL_NS}Relationship") if rel.get("Type", "").endswith("/styles")]
+    if not styles:
+        raise PatchUnsupported("no stylesheet")
+    return sheet_path, _part_path("xl/workbook.xml", styles[0])
+
+
+def _record_key(record):
+    """Canonical XML of a style record, equal for equal records however they were serialised."""
+    try:
+        return ET.canonicalize(record, strip_text=True)
+    except ET.ParseError:
+        return None
+
+
+def _record_index(records):
+    """Canonical XML -> index of the first record with it."""
+    index = {}
+    for i, record in enumerate(records):
+        key = _record_key(record)
+        if key is not None:
+            index.setdefault(key, i)
+    return index
+
+
+class StylePatcher:
+    """
+    Appends status fills and cell formats to styles.xml.
+
+    Produces the same records as StatusStyleCache does through openpyxl: a
+    solid fill per colour, and per (current format, colour) a copy of the
+    current format with the reference cell's number format, font, border,
+    alignment and protection when `copy_format` is set. A record identical
+    to one already in styles.xml (e.g. added by an earlier run) is reused,
+    so patching the same workbook again does not grow the style table.
+    Existing records are left untouched, so every style index already in
+    use stays valid.
+    """
+
+    def __init__(self, styles_xml, reference_style=None):
+        self.xml = styles_xml.decode("utf-8")
+        fills = FILLS.search(self.xml)
+        xfs = CELL_XFS.search(self.xml)
+        if fills is None or xfs is None:
+            raise PatchUnsupported("stylesheet without fills or cell formats")
+        fill_records = FILL.findall(fills.group(1))
+        self.fill_count = len(fill_records)
+        self.xfs = XF.findall(xfs.group(1))
+        self.reference = reference_style
+        self.new_fills = []
+        self.new_xfs = []
+        self.fill_ids = {}
+        self.styles = {}
+        self.fill_index = _record_index(fill_records)
+        self.xf_index = _record_index(self.xfs)
+
+    def _xf(self, index):
+        try:
+            return ET.fromstring(self.xfs[index])
+        except (IndexError, ET.ParseError) as e:
+            raise PatchUnsupported(f"cell format {index} cannot be read: {e}")
+
+    def fill_id(self, color):
+        fill_id = self.fill_ids.get(color)
+        if fill_id is None:
+            rgb = Color(rgb=color).rgb
+            fill = f'<fill><patternFill patternType="solid"><fgColor rgb="{rgb}" /><bgColor rgb="{rgb}" /></patternFill></fill>'
+            key = _record_key(fill)
+            fill_id = self.fill_index.get(key)
+            if fill_id is None:
+                self.new_fills.append(fill)
+                fill_id = self.fill_index[key] = self.fill_count + len(self.new_fills) - 1
+            self.fill_ids[color] = fill_id
+        return fill_id
+
+    def style(self, current, color, copy_format=True):
+        """Index of the cell format for a cell now using format `current`."""
+        key = (current, color, copy_format)
+        index = self.styles.get(key)
+        if index is not None:
+            return index
+
+        xf = self._xf(current)
+        if copy_format and self.reference is not None:
+            reference = self._xf(self.reference)
+            for name in FORMAT_ATTRIBUTES:
+                if reference.get(name) is None:
+                    xf.attrib.pop(name, None)
+                else:
+                    xf.set(name, reference.get(name))
+            for child in list(xf):
+                if child.tag in FORMAT_CHILDREN:
+                    xf.remove(child)
+            for position, tag in enumerate(FORMAT_CHILDREN):
+                child = reference.find(tag)
+                if child is not None:
+                    xf.insert(position, child)
+        xf.set("fillId", str(self.fill_id(color)))
+        xf.set("applyFill", "1")
+
+        xf = ET.tostring(xf, encoding="unicode")
+        record_key = _record_key(xf)
+        index = self.xf_index.get(record_key)
+        if index is None:
+            self.new_xfs.append(xf)
+            index = self.xf_index[record_key] = len(self.xfs) + len(self.new_xfs) - 1
+        self.styles[key] = index
+        return index
+
+    def to_bytes(self):
+        if not self.new_xfs:
+            return self.xml.encode("utf-8")
+        xml = FILLS.sub(
+            lambda m: f'<fills count="{self.fill_count + len(self.new_fills)}">{m.group(1)}{"".join(self.new_fills)}</fills>',
+            self.xml, count=1,
+        )
+        xml = CELL_XFS.sub(
+            lambda m: f'<cellXfs count="{len(self.xfs) + len(self.new_xfs)}">{m.group(1)}{"".join(self.new_xfs)}</cellXfs>',
+            xml, count=1,
+        )
+        return xml.encode("utf-8")
+
+
+def _cell_style(cell_xml):
+    match = STYLE_ATTR.search(CELL_HEAD.match(cell_xml).group(0))
+    return int(match.group(1)) if match else 0
+
+
+def _number_text(value):
+    """Text of a numeric cell value; numpy scalars are converted to plain Python numbers first."""
+    if isinstance(value, numbers.Integral):
+        return str(int(value))
+    return repr(float(value))
+
+
+def _render_cell(ref, old_xml, value, style):
+    """XML of a patched cell; value None keeps the old content and only restyles it."""
+    if value is None and old_xml is not None:
+        head = CELL_HEAD.match(old_xml).group(0)
+        if STYLE_ATTR.search(head):
+            new_head = STYLE_ATTR.sub(f' s="{style}"'.encode(), head, count=1)
+        else:
+            new_head = head.replace(b"<c", f'<c s="{style}"'.encode(), 1)
+        return new_head + old_xml[len(head):]
+    if old_xml is not None and FORMULA.search(old_xml):
+        raise PatchUnsupported(f"cell {ref} holds a formula")
+
+    if value is None:
+        return f'<c r="{ref}" s="{style}" />'.encode()
+    if value == "":
+        return f'<c r="{ref}" s="{style}" t="inlineStr" />'.encode()
+    if isinstance(value, numbers.Real) and not isinstance(value, bool):
+        return f'<c r="{ref}" s="{style}" t="n"><v>{_number_text(value)}</v></c>'.encode()
+    return f'<c r="{ref}" s="{style}" t="inlineStr"><is><t>{escape(str(value))}</t></is></c>'.encode()
+
+
+def _patch_row(row_xml, row_number, targets, styles):
+    """Row XML with the target cells written; targets maps column -> (value, color, copy_format)."""
+    if row_xml is None:
+        head, inner = f'<row r="{row_number}">'.encode(), b""
+    else:
+        head_match = ROW_HEAD.match(row_xml)
+        head = SPANS_ATTR.sub(b"", head_match.group(0))
+        if head_match.group(1):
+            head, inner = head[:-2].rstrip() + b">", b""
+        else:
+            inner = row_xml[head_match.end():-len(b"</row>")]
+
+    cells = {}
+    for match in CELL.finditer(inner):
+        ref = CELL_REF.search(CELL_HEAD.match(match.group(0)).group(0))
+        if ref is None:
+            raise PatchUnsupported(f"row {row_number} has cells without references")
+        cells[column_index_from_string(ref.group(1).decode())] = match.group(0)
+
+    for column, (value, color, copy_format) in targets.items():
+        old_xml = cells.get(column)
+        current = _cell_style(old_xml) if old_xml is not None else 0
+        style = styles.style(current, color, copy_format)
+        ref = f"{get_column_letter(column)}{row_number}"
+        cells[column] = _render_cell(ref, old_xml, value, style)
+
+    return head + b"".join(cells[column] for column in sorted(cells)) + b"</row>"
+
+
+def patch_sheet(sheet_xml, targets, styles):
+    """Sheet XML with the target cells written; targets maps row -> {column: (value, color, copy_format)}."""
+    data = SHEET_DATA.search(sheet_xml)
+    if data is None:
+        raise PatchUnsupported("worksheet without sheetData")
+    content = data.group(1) or b""
+
+    pending = sorted(targets)
+    parts = []
+    last_end = 0
+    for match in ROW.finditer(content):
+        row_number = int(ROW_NUMBER.search(ROW_HEAD.match(match.group(0)).group(0)).group(1))
+        parts.append(content[last_end:match.start()])
+        while pending and pending[0] < row_number:
+            missing = pending.pop(0)
+            parts.append(_patch_row(None, missing, targets[missing], styles))
+        if pending and pending[0] == row_number:
+            pending.pop(0)
+            parts.append(_patch_row(match.group(0), row_number, targets[row_number], styles))
+        else:
+            parts.append(match.group(0))
+        last_end = match.end()
+    parts.append(content[last_end:])
+    for missing in pending:
+        parts.append(_patch_row(None, missing, targets[missing], styles))
+
+    new_data = b"<sheetData>" + b"".join(parts) + b"</sheetData>"
+    return sheet_xml[:data.start()] + new_data + sheet_xml[data.end():]
+
+
+def _reference_style(sheet_xml, row, column):
+    """Format index of a cell, or None when the cell does not exist."""
+    data = SHEET_DATA.search(sheet_xml)
+    if data is None or data.group(1) is None:
+        return None
+    for match in ROW.finditer(data.group(1)):
+        if int(ROW_NUMBER.search(ROW_HEAD.match(match.group(0)).group(0)).group(1)) != row:
+            continue
+        for cell in CELL.finditer(match.group(0)):
+            ref = CELL_REF.search(CELL_HEAD.match(cell.group(0)).group(0))
+            if ref and column_index_from_string(ref.group(1).decode()) == column:
+                return _cell_style(cell.group(0))
+        return None
+    return None
+
+
+def patch_month_cells(data, output_file, cells, reference=None):
+    """
+    Write cells into the active sheet of an xlsx and save it as `output_file`.
+
+    data: bytes of the source xlsx; cells: (row, column, value, color, copy_format)
+    tuples as planned for the kids sheet (value None only restyles the cell);
+    reference: (row, column) of the cell whose format coloured cells copy.
+
+    Only the worksheet XML and styles.xml are regenerated. Every other part
+    of the package is copied unchanged, with its original zip entry.
+    Raises PatchUnsupported when the workbook has a shape this cannot handle.
+    """
+    targets = {}
+    for row, column, value, color, copy_format in cells:
+        targets.setdefault(row, {})[column] = (value, color, copy_format)
+
+    with zipfile.ZipFile(BytesIO(data)) as source:
+        sheet_path, styles_path = workbook_parts(source)
+        sheet_xml = source.read(sheet_path)
+        reference_style = _reference_style(sheet_xml, *reference) if reference else None
+        styles = StylePatcher(source.read(styles_path), reference_style)
+        patched = {sheet_path: patch_sheet(sheet_xml, targets, styles)}
+        patched[styles_path] = styles.to_bytes()
+
+        with zipfile.ZipFile(output_file, "w") as target:
+            for info in source.infolist():
+                target.writestr(info, patched.get(info.filename) or source.read(info))
+    return output_file
@@ -1,16 +1,39 @@
 import sys
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                              QHBoxLayout, QLabel, QPushButton, QLineEdit, 
-                             QFileDialog, QTableWidget, QTableWidgetItem, 
+                             QFileDialog, QTableView, 
                              QTabWidget, QSpinBox, QDoubleSpinBox, QTextEdit,
                              QMessageBox, QFrame, QScrollArea, QGroupBox,
-                             QComboBox, QCheckBox)
-from PyQt6.QtCore import Qt, QMimeData, pyqtSignal, QPropertyAnimation, QEasingCurve, QSettings
+                             QComboBox, QCheckBox, QProgressBar)
+from PyQt6.QtCore import (Qt, QMimeData, pyqtSignal, QPropertyAnimation, QEasingCurve, QSettings,
+                          QAbstractTableModel, QModelIndex, QObject, QRunnable, QThread, QThreadPool)
 from PyQt6.QtGui import QDragEnterEvent, QDropEvent, QPalette, QColor, QFont, QIcon
 import pandas as pd
 import openpyxl
 from openpyxl.styles import PatternFill
 import os
+import threading
+import time
+from functools import partial
+from pathlib import Path
+
+# The RealProject modules import each other by module name
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "RealProject"))
+
+from amount_parser import parse_amounts
+from statement_reader import CHUNK_SIZE, is_statement_csv, iter_statement_chunks
+
+# Rows looked at when sizing preview columns to their contents
+PREVIEW_SIZE_SAMPLE = 200
+
+# Seconds between two progress updates of a loading file
+LOAD_PROGRESS_INTERVAL = 0.1
+
+# Result lines sent to the results panel at once
+LOG_BATCH = 200
+
+# Kids / sheet rows between two progress updates of the update and save stages
+PROGRESS_ROWS = 500
 
 class DragDropLabel(QLabel):
     """Custom label that accepts drag and drop for files"""
@@ -55,6 +78,352 @@ class DragDropLabel(QLabel):
             self.fileDropped.emit(files[0])
         self.setStyleSheet(self.default_style)
 
+class DataFrameModel(QAbstractTableModel):
+    """
+    Read-only table model over a DataFrame's column arrays.
+
+    The view only asks for the cells it paints, so a preview of any size opens
+    without building an item per cell; cells are formatted (and checked for
+    "Paid" when highlight_paid is set) as they are requested.
+    """
+    PAID_COLOR = QColor("#005C12")
+
+    def __init__(self, df=None, highlight_paid=False, parent=None):
+        super().__init__(parent)
+        df = pd.DataFrame() if df is None else df
+        self.headers = [str(column) for column in df.columns]
+        self.columns = [df.iloc[:, j].to_numpy() for j in range(df.shape[1])]
+        self.rows = len(df)
+        self.highlight_paid = highlight_paid
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.rows
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.ItemDataRole.DisplayRole:
+            return str(self.columns[index.column()][index.row()])
+        if role == Qt.ItemDataRole.BackgroundRole and self.highlight_paid:
+            if str(self.columns[index.column()][index.row()]) == "Paid":
+                return self.PAID_COLOR
+        return None
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role != Qt.ItemDataRole.DisplayRole:
+            return None
+        if orientation == Qt.Orientation.Horizontal:
+            return self.headers[section]
+        return str(section + 1)
+
+
+class LoadCancelled(Exception):
+    """Raised inside a file load once it has been cancelled."""
+
+
+class ProgressFile:
+    """
+    Binary file handle that reports the bytes read and stops the read once cancelled.
+
+    pandas and openpyxl read through it like through a normal file, so a load
+    can show how far it got and be interrupted in the middle of a parse.
+    """
+
+    def __init__(self, file_path, cancel_event, on_read):
+        self.file = open(file_path, "rb")
+        self.size = os.path.getsize(file_path)
+        self.cancel_event = cancel_event
+        self.on_read = on_read
+
+    def _check(self):
+        if self.cancel_event.is_set():
+            raise LoadCancelled()
+        self.on_read(self.file.tell(), self.size)
+
+    def read(self, size=-1):
+        data = self.file.read(size)
+        self._check()
+        return data
+
+    def read1(self, size=-1):
+        # Used by the text wrapper pandas puts around binary handles
+        data = self.file.read1(size)
+        self._check()
+        return data
+
+    def readinto(self, buffer):
+        count = self.file.readinto(buffer)
+        self._check()
+        return count
+
+    def __getattr__(self, name):
+        # seek, tell, seekable, close... of the real file
+        return getattr(self.file, name)
+
+    def __iter__(self):
+        return iter(self.file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.file.close()
+
+
+class FileLoaderSignals(QObject):
+    """Signals of a FileLoader (a QRunnable is not a QObject)."""
+    progress = pyqtSignal(int, int, int)  # rows, bytes read, total bytes
+    loaded = pyqtSignal(object)  # DataFrame
+    failed = pyqtSignal(str)  # error message
+
+
+class FileLoader(QRunnable):
+    """Reads a parents or kids file on a thread pool thread."""
+
+    def __init__(self, file_path, file_type):
+        super().__init__()
+        self.file_path = file_path
+        self.file_type = file_type
+        self.signals = FileLoaderSignals()
+        self.cancel_event = threading.Event()
+        self.rows = 0
+        self.last_report = 0.0
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def report(self, bytes_read, total_bytes, force=False):
+        now = time.monotonic()
+        if force or now - self.last_report >= LOAD_PROGRESS_INTERVAL:
+            self.last_report = now
+            self.signals.progress.emit(self.rows, bytes_read, total_bytes)
+
+    def join_chunks(self, chunks):
+        """One DataFrame from streamed chunks, counting rows as they arrive."""
+        def counted():
+            for chunk in chunks:
+                self.rows += len(chunk)
+                yield chunk
+        return pd.concat(counted(), ignore_index=True)
+
+    def read(self, handle):
+        path = self.file_path
+        is_csv = Path(path).suffix.lower() == '.csv'  # bank exports are often named EXPORT.CSV
+        if is_csv and self.file_type == 'parents' and is_statement_csv(path):
+            # German bank export: streamed, each chunk cut down to booking date / name / amount
+            chunks = iter_statement_chunks(path, source=handle)
+            columns = {'Booking_Date': 'Booking_Date', 'parent_name': 'parents_name', 'Amount': 'amount'}
+            return self.join_chunks(chunk[list(columns)].rename(columns=columns) for chunk in chunks)
+        if is_csv:
+            return self.join_chunks(pd.read_csv(handle, chunksize=CHUNK_SIZE))
+        # The sheet is parsed in one call: bytes while it runs, rows at the end
+        return pd.read_excel(handle)
+
+    def run(self):
+        try:
+            with ProgressFile(self.file_path, self.cancel_event, self.report) as handle:
+                df = self.read(handle)
+                self.rows = len(df)
+                self.report(handle.size, handle.size, force=True)
+        except LoadCancelled:
+            return
+        except Exception as e:
+            if not self.cancel_event.is_set():
+                self.signals.failed.emit(str(e))
+            return
+        if not self.cancel_event.is_set():
+            self.signals.loaded.emit(df)
+
+
+def save_styled_workbook(df, output_file, month_columns, apply_style, on_progress=None):
+    """Write df to output_file and, with apply_style, fill its "Paid" month cells green."""
+    df.to_excel(output_file, index=False)
+    if not apply_style:
+        return
+    
+    wb = openpyxl.load_workbook(output_file)
+    ws = wb.active
+    
+    green_fill = PatternFill(start_color="C6EFCE", end_color="C6EFCE", fill_type="solid")
+    
+    headers = [cell.value for cell in ws[1]]
+    month_col_indices = [idx for idx, h in enumerate(headers, start=1) if h in month_columns]
+    
+    for i, row in enumerate(ws.iter_rows(min_row=2, max_row=ws.max_row)):
+        if on_progress is not None and i % PROGRESS_ROWS == 0:
+            on_progress(i / ws.max_row)
+        for col_idx in month_col_indices:
+            cell = row[col_idx - 1]
+            if cell.value == "Paid":
+                cell.fill = green_fill
+                
+    wb.save(output_file)
+
+
+class PaymentWorker(QThread):
+    """
+    Runs the payment pipeline (match, allocate, update, save) off the GUI thread.
+
+    Result lines are sent to the results panel as each stage produces them,
+    and progress is reported per stage for a determinate progress bar.
+    """
+    progress = pyqtSignal(int, str)  # percent, stage
+    log = pyqtSignal(str)
+    done = pyqtSignal(object, str, str)  # updated kids DataFrame, saved file, save error
+    failed = pyqtSignal(str)  # error message
+
+    def __init__(self, parents_df, kids_df, monthly_fee, month_columns, sort_kids=True,
+                 output_file=None, apply_style=True):
+        super().__init__()
+        self.parents_df = parents_df
+        self.kids_df = kids_df
+        self.monthly_fee = monthly_fee
+        self.month_columns = month_columns
+        self.sort_kids = sort_kids
+        self.output_file = output_file
+        self.apply_style = apply_style
+        self.stages = ["match", "allocate", "update"] + (["save"] if output_file else [])
+
+    def stage_progress(self, stage, fraction=0.0):
+        percent = int(100 * (self.stages.index(stage) + fraction) / len(self.stages))
+        self.progress.emit(percent, stage)
+
+    def emit_lines(self, lines):
+        for start in range(0, len(lines), LOG_BATCH):
+            self.log.emit("\n".join(lines[start:start + LOG_BATCH]))
+
+    def run(self):
+        try:
+            # Find parent-kid relationships
+            self.stage_progress("match")
+            self.log.emit("👨‍👩‍👧‍👦 Finding parent-kid relationships...")
+            parent_kid_map = self.find_kids_of_parents(self.parents_df, self.kids_df)
+            if self.sort_kids:
+                # Listing kids from less paid months to more
+                parent_kid_map = self.listing_parent_kid_map(parent_kid_map, self.kids_df)
+            self.emit_lines([f"  • {parent} → {', '.join(kids)}" for parent, kids in parent_kid_map.items()] + [""])
+            
+            # Calculate months paid
+            self.stage_progress("allocate")
+            self.log.emit("💰 Calculating payments...")
+            kids_months_paid = self.calculate_months_paid(self.parents_df, parent_kid_map, self.monthly_fee)
+            self.emit_lines([f"  • {kid}: {months} months paid" for kid, months in kids_months_paid.items()] + [""])
+            
+            # Update dataframe
+            self.stage_progress("update")
+            self.log.emit("📝 Updating kids payment records...")
+            updated_kids_df = self.update_kids_months_paid(kids_months_paid, self.kids_df.copy())
+            self.log.emit("\n✅ Processing complete!")
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        
+        save_error = ""
+        if self.output_file:
+            self.stage_progress("save")
+            self.log.emit("\n💾 Auto-saving results...")
+            try:
+                save_styled_workbook(
+                    updated_kids_df, self.output_file, self.month_columns, self.apply_style,
+                    on_progress=lambda fraction: self.stage_progress("save", fraction)
+                )
+                self.log.emit(f"✅ File saved successfully to:\n   {os.path.abspath(self.output_file)}")
+            except Exception as e:
+                save_error = str(e)
+        self.progress.emit(100, "done")
+        self.done.emit(updated_kids_df, self.output_file or "", save_error)
+
+    def find_kids_of_parents(self, parents_df, kids_df):
+        distinct_parents = parents_df['parents_name'].dropna().unique()
+        distinct_kids = kids_df['kid_name'].dropna().unique()
+        parent_kid_map = {}
+        
+        for parent in distinct_parents:
+            last_name_parent = parent.split()[-1]
+            matched_kids = [kid for kid in distinct_kids if last_name_parent.lower() == kid.split()[-1].lower()]
+            # matched_kids = [kid for kid in distinct_kids if last_name_parent == kid.split()[-1]]
+            if matched_kids:
+                parent_kid_map[parent] = matched_kids
+                
+        return parent_kid_map
+
+    def listing_parent_kid_map(self, parent_kid_map, kids_df):
+        listed_parent_kid_map = {}
+        
+        for parent, kids in parent_kid_map.items():
+            kids_months = {}
+            for kid in kids:
+                kid_row = kids_df[kids_df['kid_name'] == kid]
+                if not kid_row.empty:
+                    paid_months = sum(1 for month in self.month_columns if str(kid_row.iloc[0][month]).strip().lower() == 'paid')
+                    kids_months[kid] = paid_months
+                else:
+                    kids_months[kid] = 0
+                    
+            # Sort kids by months paid (ascending)
+            sorted_kids = sorted(kids_months.items(), key=lambda x: x[1])
+            listed_parent_kid_map[parent] = [kid for kid, _ in sorted_kids]
+            
+        return listed_parent_kid_map
+
+    def calculate_months_paid(self, parents_df, parent_kid_map, monthly_fee):
+        amounts, invalid = parse_amounts(parents_df['amount'])
+        if invalid.any():
+            rows = ', '.join(str(i + 2) for i in parents_df.index[invalid][:10])
+            self.log.emit(f"⚠️ {int(invalid.sum())} amount(s) could not be read and count as 0 (rows {rows})")
+        parents_amount = dict(zip(
+            parents_df['parents_name'], 
+            (amounts.fillna(0) / monthly_fee).round().astype(int)
+        ))
+        
+        kids_months_paid = {}
+        
+        for parent, kids in parent_kid_map.items():
+            if parent in parents_amount:
+                months_paid = parents_amount[parent]
+                num_kids = len(kids)
+                months_per_kid = months_paid // num_kids if num_kids > 0 else 0
+                months_module = months_paid % num_kids if num_kids > 0 else 0
+                
+                for kid in kids:
+                    kids_months_paid[kid] = months_per_kid + (1 if months_module > 0 else 0)
+                    months_module -= 1 if months_module > 0 else 0
+                    
+        return kids_months_paid
+        
+    def update_kids_months_paid(self, kids_months_paid, kids_df):
+        updated_df = kids_df.copy()
+        
+        for i, (kid_name, months_to_pay) in enumerate(kids_months_paid.items()):
+            if i % PROGRESS_ROWS == 0:
+                self.stage_progress("update", i / len(kids_months_paid))
+            kid_mask = updated_df['kid_name'] == kid_name
+            
+            if kid_mask.any():
+                row_idx = updated_df[kid_mask].index[0]
+                updated_row = self.mark_paid(updated_df.loc[row_idx], months_to_pay)
+                updated_df.loc[row_idx] = updated_row
+                
+        return updated_df
+        
+    def mark_paid(self, row, months_to_pay):
+        start_idx = 0
+        for i, month_col in enumerate(self.month_columns):
+            if pd.isna(row[month_col]) or row[month_col] == '':
+                start_idx = i
+                break
+        else:
+            return row
+            
+        for i in range(start_idx, min(start_idx + months_to_pay, len(self.month_columns))):
+            row[self.month_columns[i]] = "Paid"
+            
+        return row
+
+
 class PaymentTrackerApp(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -67,6 +436,12 @@ class PaymentTrackerApp(QMainWindow):
         self.parents_file = None
         self.kids_file = None
         
+        # Background file loading: parents and kids load side by side
+        self.thread_pool = QThreadPool()
+        self.thread_pool.setMaxThreadCount(2)
+        self.loaders = {}
+        self.worker = None
+        
         # Settings
         self.settings = QSettings("PaymentTracker", "KidsPayments")
         
@@ -179,6 +554,11 @@ class PaymentTrackerApp(QMainWindow):
         parents_browse.clicked.connect(lambda: self.browse_file('parents'))
         parents_btn_layout.addWidget(parents_browse)
 
+        self.parents_cancel = QPushButton("✖ Cancel")
+        self.parents_cancel.clicked.connect(lambda: self.cancel_load('parents'))
+        self.parents_cancel.setVisible(False)
+        parents_btn_layout.addWidget(self.parents_cancel)
+
         self.parents_status = QLabel("No file loaded")
         self.parents_status.setStyleSheet("color: #666; font-style: italic;")
         parents_btn_layout.addWidget(self.parents_status)
@@ -201,6 +581,11 @@ class PaymentTrackerApp(QMainWindow):
         kids_browse.clicked.connect(lambda: self.browse_file('kids'))
         kids_btn_layout.addWidget(kids_browse)
 
+        self.kids_cancel = QPushButton("✖ Cancel")
+        self.kids_cancel.clicked.connect(lambda: self.cancel_load('kids'))
+        self.kids_cancel.setVisible(False)
+        kids_btn_layout.addWidget(self.kids_cancel)
+
         self.kids_status = QLabel("No file loaded")
         self.kids_status.setStyleSheet("color: #666; font-style: italic;")
         kids_btn_layout.addWidget(self.kids_status)
@@ -342,6 +727,13 @@ class PaymentTrackerApp(QMainWindow):
         process_layout.addWidget(self.process_btn)
         layout.addLayout(process_layout)
         
+        # Pipeline progress (match, allocate, update, save)
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 100)
+        self.progress_bar.setValue(0)
+        self.progress_bar.setFormat("%p%")
+        layout.addWidget(self.progress_bar)
+        
         # Results text area
         results_label = QLabel("<b>📋 Processing Results:</b>")
         layout.addWidget(results_label)
@@ -401,9 +793,13 @@ class PaymentTrackerApp(QMainWindow):
         
         layout.addLayout(selector_layout)
         
-        # Table
-        self.preview_table = QTableWidget()
+        # Table (model based: only visible rows are rendered)
+        self.preview_table = QTableView()
         self.preview_table.setAlternatingRowColors(True)
+        # Size columns from the first rows instead of every row
+        self.preview_table.horizontalHeader().setResizeContentsPrecision(PREVIEW_SIZE_SAMPLE)
+        self.preview_model = DataFrameModel()
+        self.preview_table.setModel(self.preview_model)
         layout.addWidget(self.preview_table)
         
         return widget
@@ -419,229 +815,163 @@ class PaymentTrackerApp(QMainWindow):
         if folder:
             self.custom_location_input.setText(folder)
             
-    def process_and_auto_save(self):
-        """Process payments and automatically save, then switch to results tab"""
-        if self.parents_df is None or self.kids_df is None:
-            QMessageBox.warning(self, "Missing Data", "Please load both parent and kids files first!")
-            return
-            
-        try:
-            # Switch to results tab
-            self.tabs.setCurrentIndex(1)
-            
-            # Process payments
-            self.results_text.clear()
-            self.results_text.append("🔄 Starting payment processing...\n")
-            
-            monthly_fee = self.fee_input.value()
-            
-            # Find parent-kid relationships
-            self.results_text.append("👨‍👩‍👧‍👦 Finding parent-kid relationships...")
-            parent_kid_map = self.find_kids_of_parents(self.parents_df, self.kids_df)
-            
-            # Listing kids from less paid months to more 
-            listed_parent_kid_map = {}
-            listed_parent_kid_map = self.listing_parent_kid_map(parent_kid_map , self.kids_df )
-
-            for parent, kids in listed_parent_kid_map.items():
-                self.results_text.append(f"  • {parent} → {', '.join(kids)}")
-            self.results_text.append("")
-            
-            # Calculate months paid
-            self.results_text.append("💰 Calculating payments...")
-            kids_months_paid = self.calculate_months_paid(self.parents_df, listed_parent_kid_map, monthly_fee)
-            
-            for kid, months in kids_months_paid.items():
-                self.results_text.append(f"  • {kid}: {months} months paid")
-            self.results_text.append("")
-            
-            # Update dataframe
-            self.results_text.append("📝 Updating kids payment records...")
-            self.updated_kids_df = self.update_kids_months_paid(kids_months_paid, self.kids_df.copy())
-            
-            self.results_text.append("\n✅ Processing complete!")
-            
-            # Auto-save
-            self.results_text.append("\n💾 Auto-saving results...")
-            self.auto_save_results()
-            
-            self.save_btn.setEnabled(True)
-            self.update_preview()
-            
-        except Exception as e:
-            QMessageBox.critical(self, "Processing Error", f"Error during processing:\n{str(e)}")
-            self.results_text.append(f"\n❌ Error: {str(e)}")
-
-
-    def auto_save_results(self):
-        """Automatically save results to specified location"""
-        try:
-            # Determine output path
-            output_filename = self.output_input.text()
-            
-            if self.use_default_location.isChecked():
-                output_file = output_filename
-            else:
-                custom_folder = self.custom_location_input.text()
-                if not custom_folder:
-                    raise Exception("Custom location not specified")
-                output_file = os.path.join(custom_folder, output_filename)
-            
-            # Save to Excel
-            self.updated_kids_df.to_excel(output_file, index=False)
-            
-            # Apply styling if checked
-            if self.apply_style_check.isChecked():
-                wb = openpyxl.load_workbook(output_file)
-                ws = wb.active
-                
-                green_fill = PatternFill(start_color="C6EFCE", end_color="C6EFCE", fill_type="solid")
-                
-                headers = [cell.value for cell in ws[1]]
-                month_col_indices = [idx for idx, h in enumerate(headers, start=1) if h in self.month_columns]
-                
-                for row in ws.iter_rows(min_row=2, max_row=ws.max_row):
-                    for col_idx in month_col_indices:
-                        cell = row[col_idx - 1]
-                        if cell.value == "Paid":
-                            cell.fill = green_fill
-                            
-                wb.save(output_file)
-            
-            self.results_text.append(f"✅ File saved successfully to:\n   {os.path.abspath(output_file)}")
-            self.open_btn.setEnabled(True)
-            
-            # Show success message
-            QMessageBox.information(
-                self, 
-                "Success! 🎉", 
-                f"Processing complete!\n\nFile saved to:\n{os.path.abspath(output_file)}"
-            )
-            
-        except Exception as e:
-            QMessageBox.critical(self, "Save Error", f"Failed to save file:\n{str(e)}")
-            self.results_text.append(f"\n❌ Save Error: {str(e)}")
-        file_name, _ = QFileDialog.getOpenFileName(
-            self, f"Select {file_type.title()} File", 
-            "", "Excel Files (*.xlsx *.xls);;CSV Files (*.csv);;All Files (*)"
-        )
-        if file_name:
-            self.load_file(file_name, file_type)
+    def file_widgets(self, file_type):
+        """(status label, drop label, cancel button) of the parents or kids file."""
+        if file_type == 'parents':
+            return self.parents_status, self.parents_drop, self.parents_cancel
+        return self.kids_status, self.kids_drop, self.kids_cancel
             
     def load_file(self, file_path, file_type):
-        try:
-            if file_path.endswith('.csv'):
-                df = pd.read_csv(file_path)
-            else:
-                df = pd.read_excel(file_path)
-                
-            if file_type == 'parents':
-                self.parents_df = df
-                self.parents_file = file_path
-                self.parents_status.setText(f"✅ Loaded: {os.path.basename(file_path)} ({len(df)} rows)")
-                self.parents_status.setStyleSheet("color: green;")
-                self.parents_drop.setText(f"✅ {os.path.basename(file_path)}\n{len(df)} rows loaded")
-            else:
-                self.kids_df = df
-                self.kids_file = file_path
-                self.kids_status.setText(f"✅ Loaded: {os.path.basename(file_path)} ({len(df)} rows)")
-                self.kids_status.setStyleSheet("color: green;")
-                self.kids_drop.setText(f"✅ {os.path.basename(file_path)}\n{len(df)} rows loaded")
-                
-            self.update_preview()
+        """Load a file on the thread pool; a load still running for the same side is cancelled."""
+        self.cancel_load(file_type)
+        
+        loader = FileLoader(file_path, file_type)
+        loader.signals.progress.connect(partial(self.on_load_progress, loader))
+        loader.signals.loaded.connect(partial(self.on_file_loaded, loader))
+        loader.signals.failed.connect(partial(self.on_load_failed, loader))
+        self.loaders[file_type] = loader
+        
+        status, drop, cancel = self.file_widgets(file_type)
+        status.setText(f"⏳ Loading {os.path.basename(file_path)}...")
+        status.setStyleSheet("color: #666; font-style: italic;")
+        drop.setText(f"⏳ {os.path.basename(file_path)}\nLoading...")
+        cancel.setVisible(True)
+        self.thread_pool.start(loader)
+        
+    def cancel_load(self, file_type):
+        loader = self.loaders.pop(file_type, None)
+        if loader is not None:
+            loader.cancel()
+            self.show_loaded_file(file_type)
+            
+    def is_current_load(self, loader):
+        """False for loads that were cancelled or replaced by a newer drop."""
+        return self.loaders.get(loader.file_type) is loader
+        
+    def show_loaded_file(self, file_type):
+        """Reset the file's widgets to the file currently loaded, if any."""
+        status, drop, cancel = self.file_widgets(file_type)
+        cancel.setVisible(False)
+        df = self.parents_df if file_type == 'parents' else self.kids_df
+        file_path = self.parents_file if file_type == 'parents' else self.kids_file
+        if df is None:
+            status.setText("No file loaded")
+            status.setStyleSheet("color: #666; font-style: italic;")
+            drop.setText("🖱️ Drag & Drop Excel/CSV file here\nor click below to browse")
+        else:
+            status.setText(f"✅ Loaded: {os.path.basename(file_path)} ({len(df)} rows)")
+            status.setStyleSheet("color: green;")
+            drop.setText(f"✅ {os.path.basename(file_path)}\n{len(df)} rows loaded")
             
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to load file:\n{str(e)}")
+    def on_load_progress(self, loader, rows, bytes_read, total_bytes):
+        if not self.is_current_load(loader):
+            return
+        status, drop, _ = self.file_widgets(loader.file_type)
+        name = os.path.basename(loader.file_path)
+        percent = 100 * bytes_read // total_bytes if total_bytes else 100
+        rows_text = f", {rows:,} rows" if rows else ""
+        status.setText(f"⏳ Loading {name}: {percent}% ({bytes_read / 1e6:.1f} of {total_bytes / 1e6:.1f} MB{rows_text})")
+        drop.setText(f"⏳ {name}\n{percent}% loaded")
+            
+    def on_file_loaded(self, loader, df):
+        if not self.is_current_load(loader):
+            return
+        del self.loaders[loader.file_type]
+        if loader.file_type == 'parents':
+            self.parents_df = df
+            self.parents_file = loader.file_path
+        else:
+            self.kids_df = df
+            self.kids_file = loader.file_path
+        self.show_loaded_file(loader.file_type)
+        self.update_preview()
+        
+    def on_load_failed(self, loader, error):
+        if not self.is_current_load(loader):
+            return
+        del self.loaders[loader.file_type]
+        self.show_loaded_file(loader.file_type)
+        QMessageBox.critical(self, "Error", f"Failed to load file:\n{error}")
     
     def process_and_auto_save(self):
         """Process payments and automatically save, then switch to results tab"""
-        if self.parents_df is None or self.kids_df is None:
-            QMessageBox.warning(self, "Missing Data", "Please load both parent and kids files first!")
+        if not self.can_process():
             return
             
+        # Switch to results tab
+        self.tabs.setCurrentIndex(1)
+        
         try:
-            # Switch to results tab
-            self.tabs.setCurrentIndex(1)
-            
-            # Process payments
-            self.results_text.clear()
-            self.results_text.append("🔄 Starting payment processing...\n")
-            
-            monthly_fee = self.fee_input.value()
-            
-            # Find parent-kid relationships
-            self.results_text.append("👨‍👩‍👧‍👦 Finding parent-kid relationships...")
-            parent_kid_map = self.find_kids_of_parents(self.parents_df, self.kids_df)
-            
-            # Listing kids from less paid months to more 
-            listed_parent_kid_map = {}
-            listed_parent_kid_map = self.listing_parent_kid_map(parent_kid_map , self.kids_df )
-
-            for parent, kids in listed_parent_kid_map.items():
-                self.results_text.append(f"  • {parent} → {', '.join(kids)}")
-            self.results_text.append("")
-            
-            # Calculate months paid
-            self.results_text.append("💰 Calculating payments...")
-            kids_months_paid = self.calculate_months_paid(self.parents_df, listed_parent_kid_map, monthly_fee)
-            
-            for kid, months in kids_months_paid.items():
-                self.results_text.append(f"  • {kid}: {months} months paid")
-            self.results_text.append("")
-            
-            # Update dataframe
-            self.results_text.append("📝 Updating kids payment records...")
-            self.updated_kids_df = self.update_kids_months_paid(kids_months_paid, self.kids_df.copy())
-            
-            self.results_text.append("\n✅ Processing complete!")
-            
-            # Auto-save
-            self.results_text.append("\n💾 Auto-saving results...")
-            self.auto_save_results()
-            
-            self.save_btn.setEnabled(True)
-            self.update_preview()
-            
+            output_file = self.auto_save_path()
         except Exception as e:
-            QMessageBox.critical(self, "Processing Error", f"Error during processing:\n{str(e)}")
-            self.results_text.append(f"\n❌ Error: {str(e)}")
-            
-    def auto_save_results(self):
-        """Automatically save results to specified location"""
-        try:
-            # Determine output path
-            output_filename = self.output_input.text()
+            QMessageBox.critical(self, "Save Error", f"Failed to save file:\n{str(e)}")
+            return
             
-            if self.use_default_location.isChecked():
-                output_file = output_filename
-            else:
-                custom_folder = self.custom_location_input.text()
-                if not custom_folder:
-                    raise Exception("Custom location not specified")
-                output_file = os.path.join(custom_folder, output_filename)
+        self.start_processing(sort_kids=True, output_file=output_file)
             
-            # Save to Excel
-            self.updated_kids_df.to_excel(output_file, index=False)
+    def auto_save_path(self):
+        """Output path from the output name and location settings."""
+        output_filename = self.output_input.text()
+        
+        if self.use_default_location.isChecked():
+            return output_filename
+        custom_folder = self.custom_location_input.text()
+        if not custom_folder:
+            raise Exception("Custom location not specified")
+        return os.path.join(custom_folder, output_filename)
             
-            # Apply styling if checked
-            if self.apply_style_check.isChecked():
-                wb = openpyxl.load_workbook(output_file)
-                ws = wb.active
-                
-                green_fill = PatternFill(start_color="C6EFCE", end_color="C6EFCE", fill_type="solid")
-                
-                headers = [cell.value for cell in ws[1]]
-                month_col_indices = [idx for idx, h in enumerate(headers, start=1) if h in self.month_columns]
-                
-                for row in ws.iter_rows(min_row=2, max_row=ws.max_row):
-                    for col_idx in month_col_indices:
-                        cell = row[col_idx - 1]
-                        if cell.value == "Paid":
-                            cell.fill = green_fill
-                            
-                wb.save(output_file)
+    def process_payments(self):
+        if self.can_process():
+            self.start_processing(sort_kids=False)
+            
+    def can_process(self):
+        if self.worker is not None:
+            return False
+        if self.loaders:
+            QMessageBox.warning(self, "Loading", "Please wait until the files have finished loading!")
+            return False
+        if self.parents_df is None or self.kids_df is None:
+            QMessageBox.warning(self, "Missing Data", "Please load both parent and kids files first!")
+            return False
+        return True
             
-            self.results_text.append(f"✅ File saved successfully to:\n   {os.path.abspath(output_file)}")
+    def start_processing(self, sort_kids, output_file=None):
+        """Run the pipeline on a PaymentWorker; results arrive through its signals."""
+        self.results_text.clear()
+        self.results_text.append("🔄 Starting payment processing...\n")
+        
+        self.worker = PaymentWorker(
+            self.parents_df, self.kids_df, self.fee_input.value(), self.month_columns,
+            sort_kids=sort_kids, output_file=output_file, apply_style=self.apply_style_check.isChecked()
+        )
+        self.worker.progress.connect(self.on_processing_progress)
+        self.worker.log.connect(self.results_text.append)
+        self.worker.done.connect(self.on_processing_done)
+        self.worker.failed.connect(self.on_processing_failed)
+        # The worker is dropped only once its thread has ended
+        self.worker.finished.connect(self.finish_processing)
+        
+        self.progress_bar.setValue(0)
+        self.main_process_btn.setEnabled(False)
+        self.process_btn.setEnabled(False)
+        self.worker.start()
+        
+    def finish_processing(self):
+        self.worker = None
+        self.main_process_btn.setEnabled(True)
+        self.process_btn.setEnabled(True)
+        
+    def on_processing_progress(self, percent, stage):
+        self.progress_bar.setValue(percent)
+        self.progress_bar.setFormat(f"{stage}: %p%")
+        
+    def on_processing_done(self, updated_kids_df, output_file, save_error):
+        self.updated_kids_df = updated_kids_df
+        
+        if save_error:
+            QMessageBox.critical(self, "Save Error", f"Failed to save file:\n{save_error}")
+            self.results_text.append(f"\n❌ Save Error: {save_error}")
+        elif output_file:
             self.open_btn.setEnabled(True)
             
             # Show success message
@@ -651,138 +981,14 @@ class PaymentTrackerApp(QMainWindow):
                 f"Processing complete!\n\nFile saved to:\n{os.path.abspath(output_file)}"
             )
             
-        except Exception as e:
-            QMessageBox.critical(self, "Save Error", f"Failed to save file:\n{str(e)}")
-            self.results_text.append(f"\n❌ Save Error: {str(e)}")
-            
-    def process_payments(self):
-        if self.parents_df is None or self.kids_df is None:
-            QMessageBox.warning(self, "Missing Data", "Please load both parent and kids files first!")
-            return
-            
-        try:
-            self.results_text.clear()
-            self.results_text.append("🔄 Starting payment processing...\n")
-            
-            monthly_fee = self.fee_input.value()
-            
-            # Find parent-kid relationships
-            self.results_text.append("👨‍👩‍👧‍👦 Finding parent-kid relationships...")
-            parent_kid_map = self.find_kids_of_parents(self.parents_df, self.kids_df)
-            
-            for parent, kids in parent_kid_map.items():
-                self.results_text.append(f"  • {parent} → {', '.join(kids)}")
-            self.results_text.append("")
-            
-            # Calculate months paid
-            self.results_text.append("💰 Calculating payments...")
-            kids_months_paid = self.calculate_months_paid(self.parents_df, parent_kid_map, monthly_fee)
-            
-            for kid, months in kids_months_paid.items():
-                self.results_text.append(f"  • {kid}: {months} months paid")
-            self.results_text.append("")
-            
-            # Update dataframe
-            self.results_text.append("📝 Updating kids payment records...")
-            self.updated_kids_df = self.update_kids_months_paid(kids_months_paid, self.kids_df.copy())
-            
-            self.results_text.append("\n✅ Processing complete!")
-            self.save_btn.setEnabled(True)
-            
-            self.update_preview()
-            
-        except Exception as e:
-            QMessageBox.critical(self, "Processing Error", f"Error during processing:\n{str(e)}")
-            self.results_text.append(f"\n❌ Error: {str(e)}")
-            
-    def find_kids_of_parents(self, parents_df, kids_df):
-        distinct_parents = parents_df['parents_name'].dropna().unique()
-        distinct_kids = kids_df['kid_name'].dropna().unique()
-        parent_kid_map = {}
-        
-        for parent in distinct_parents:
-            last_name_parent = parent.split()[-1]
-            matched_kids = [kid for kid in distinct_kids if last_name_parent.lower() == kid.split()[-1].lower()]
-            # matched_kids = [kid for kid in distinct_kids if last_name_parent == kid.split()[-1]]
-            if matched_kids:
-                parent_kid_map[parent] = matched_kids
-                
-        return parent_kid_map
-
-    def listing_parent_kid_map(self, parent_kid_map, kids_df):
-        listed_parent_kid_map = {}
-        
-        for parent, kids in parent_kid_map.items():
-            kids_months = {}
-            for kid in kids:
-                kid_row = kids_df[kids_df['kid_name'] == kid]
-                if not kid_row.empty:
-                    paid_months = sum(1 for month in self.month_columns if str(kid_row.iloc[0][month]).strip().lower() == 'paid')
-                    kids_months[kid] = paid_months
-                else:
-                    kids_months[kid] = 0
-                    
-            # Sort kids by months paid (ascending)
-            sorted_kids = sorted(kids_months.items(), key=lambda x: x[1])
-            listed_parent_kid_map[parent] = [kid for kid, _ in sorted_kids]
-            
-        return listed_parent_kid_map
-
-    def getting_amount_from_string(self, amount_str):
-        try:
-            amount = int(''.join(filter(str.isdigit, str(amount_str))))
-            return amount
-        except:
-            return 0.0
-            
-    def calculate_months_paid(self, parents_df, parent_kid_map, monthly_fee):
-        parents_amount = dict(zip(
-            parents_df['parents_name'], 
-            (parents_df['amount'].apply(self.getting_amount_from_string) / monthly_fee).round().astype(int)
-        ))
-        
-        kids_months_paid = {}
-        
-        for parent, kids in parent_kid_map.items():
-            if parent in parents_amount:
-                months_paid = parents_amount[parent]
-                num_kids = len(kids)
-                months_per_kid = months_paid // num_kids if num_kids > 0 else 0
-                months_module = months_paid % num_kids if num_kids > 0 else 0
-                
-                for kid in kids:
-                    kids_months_paid[kid] = months_per_kid + (1 if months_module > 0 else 0)
-                    months_module -= 1 if months_module > 0 else 0
-                    
-        return kids_months_paid
-        
-    def update_kids_months_paid(self, kids_months_paid, kids_df):
-        updated_df = kids_df.copy()
-        
-        for kid_name, months_to_pay in kids_months_paid.items():
-            kid_mask = updated_df['kid_name'] == kid_name
-            
-            if kid_mask.any():
-                row_idx = updated_df[kid_mask].index[0]
-                updated_row = self.mark_paid(updated_df.loc[row_idx], months_to_pay)
-                updated_df.loc[row_idx] = updated_row
-                
-        return updated_df
+        self.save_btn.setEnabled(True)
+        self.update_preview()
         
-    def mark_paid(self, row, months_to_pay):
-        start_idx = 0
-        for i, month_col in enumerate(self.month_columns):
-            if pd.isna(row[month_col]) or row[month_col] == '':
-                start_idx = i
-                break
-        else:
-            return row
-            
-        for i in range(start_idx, min(start_idx + months_to_pay, len(self.month_columns))):
-            row[self.month_columns[i]] = "Paid"
+    def on_processing_failed(self, error):
+        self.progress_bar.setFormat("failed")
+        QMessageBox.critical(self, "Processing Error", f"Error during processing:\n{error}")
+        self.results_text.append(f"\n❌ Error: {error}")
             
-        return row
-        
     def save_results(self):
         if not hasattr(self, 'updated_kids_df'):
             QMessageBox.warning(self, "No Results", "Please process payments first!")
@@ -790,24 +996,7 @@ class PaymentTrackerApp(QMainWindow):
             
         try:
             output_file = self.output_input.text()
-            self.updated_kids_df.to_excel(output_file, index=False)
-            
-            if self.apply_style_check.isChecked():
-                wb = openpyxl.load_workbook(output_file)
-                ws = wb.active
-                
-                green_fill = PatternFill(start_color="C6EFCE", end_color="C6EFCE", fill_type="solid")
-                
-                headers = [cell.value for cell in ws[1]]
-                month_col_indices = [idx for idx, h in enumerate(headers, start=1) if h in self.month_columns]
-                
-                for row in ws.iter_rows(min_row=2, max_row=ws.max_row):
-                    for col_idx in month_col_indices:
-                        cell = row[col_idx - 1]
-                        if cell.value == "Paid":
-                            cell.fill = green_fill
-                            
-                wb.save(output_file)
+            save_styled_workbook(self.updated_kids_df, output_file, self.month_columns, self.apply_style_check.isChecked())
                 
             QMessageBox.information(self, "Success", f"✅ File saved successfully:\n{output_file}")
             self.open_btn.setEnabled(True)
@@ -843,24 +1032,10 @@ class PaymentTrackerApp(QMainWindow):
         elif selection == "Updated Kids List" and hasattr(self, 'updated_kids_df'):
             df = self.updated_kids_df
             
+        self.preview_model = DataFrameModel(df, highlight_paid=selection == "Updated Kids List")
+        self.preview_table.setModel(self.preview_model)
         if df is not None:
-            self.preview_table.setRowCount(len(df))
-            self.preview_table.setColumnCount(len(df.columns))
-            self.preview_table.setHorizontalHeaderLabels(df.columns.tolist())
-            
-            for i in range(len(df)):
-                for j in range(len(df.columns)):
-                    item = QTableWidgetItem(str(df.iloc[i, j]))
-                    if hasattr(self, 'updated_kids_df') and selection == "Updated Kids List":
-                        if str(df.iloc[i, j]) == "Paid":
-                            item.setBackground(QColor("#005C12"))
-                            # item.setBackground(QColor("#C6EFCE"))
-                    self.preview_table.setItem(i, j, item)
-                    
             self.preview_table.resizeColumnsToContents()
-        else:
-            self.preview_table.setRowCount(0)
-            self.preview_table.setColumnCount(0)
             
     def toggle_theme(self):
         self.dark_mode = not self.dark_mode
@@ -911,7 +1086,7 @@ class PaymentTrackerApp(QMainWindow):
                     border-radius: 4px;
                     color: #e0e0e0;
                 }
-                QTableWidget {
+                QTableView {
                     background-color: #2d2d2d;
                     border: 1px solid #444;
                     gridline-color: #444;
@@ -979,7 +1154,7 @@ class PaymentTrackerApp(QMainWindow):
                     border: 1px solid #ccc;
                     border-radius: 4px;
                 }
-                QTableWidget {
+                QTableView {
                     background-color: white;
                     border: 1px solid #ccc;
                     gridline-color: #ddd;
@@ -3,7 +3,7 @@
 
 a = Analysis(
     ['c_pay.py'],
-    pathex=[],
+    pathex=['RealProject'],
     binaries=[],
     datas=[],
     hiddenimports=[],
@@ -2,23 +2,13 @@ import openpyxl
 from openpyxl.styles import Font, Alignment
 import pandas as pd
 
-# Load the Excel file (or CSV)
-parents_df = pd.read_excel("parents_payments.xlsx")
-kids_df = pd.read_excel("kids_list.xlsx")
+from RealProject.amount_parser import parse_amounts
 
 monthly_fee_per_kid = 20.0  # Example monthly fee per kid
 
 # List of month columns - renamed to avoid conflict
 month_columns = ['January','February','March','April','May','June','July','August','September','October','November','December']
 
-print("Data loaded successfully.")
-
-print("Showing data samples:")
-print("Parents Payments Data:")
-print(parents_df.head())
-print("\nKids Full Names Data:")
-print(kids_df.head())
-
 
 # find parents names in kids full names
 def find_kids_of_parrents(parents_df, kids_df):
@@ -35,15 +25,12 @@ def find_kids_of_parrents(parents_df, kids_df):
             # print(f"Parent: {parent} has kids: {matched_kids}")
     return parent_kid_map
 
-def getting_mount_from_string(amount_str):
-    try:
-        amount = int(''.join(filter(str.isdigit, amount_str)))
-        return amount
-    except:
-        return 0.0
-
-def calculate_months_paid(parents_df = parents_df, parent_kid_map = {} , monthly_fee_per_kid=20.0):
-    parents_mount = dict(zip(parents_df['parents_name'], (parents_df['amount'].apply(getting_mount_from_string)/monthly_fee_per_kid).round().astype(int)))
+def calculate_months_paid(parents_df, parent_kid_map = {} , monthly_fee_per_kid=20.0):
+    amounts, invalid = parse_amounts(parents_df['amount'])
+    if invalid.any():
+        print(f"Could not read {int(invalid.sum())} amount(s), counted as 0:")
+        print(parents_df.loc[invalid, ['parents_name', 'amount']])
+    parents_mount = dict(zip(parents_df['parents_name'], (amounts.fillna(0)/monthly_fee_per_kid).round().astype(int)))
     print("Parents mount calculated:")
     print(parents_mount)
 
@@ -109,59 +96,76 @@ def mark_paid(row, months_to_pay):
     
     return row
 
-print("Finding distinct parents...")
-parent_kid_map = find_kids_of_parrents(parents_df, kids_df)
+def main():
+    # Load the Excel file (or CSV)
+    parents_df = pd.read_excel("parents_payments.xlsx")
+    kids_df = pd.read_excel("kids_list.xlsx")
+
+    print("Data loaded successfully.")
+
+    print("Showing data samples:")
+    print("Parents Payments Data:")
+    print(parents_df.head())
+    print("\nKids Full Names Data:")
+    print(kids_df.head())
+
+    print("Finding distinct parents...")
+    parent_kid_map = find_kids_of_parrents(parents_df, kids_df)
+
+    print("Print parents to their kids:")
+    for parent, kids in parent_kid_map.items():
+        print(f"Parent: {parent} -> Kids: {', '.join(kids)}")
+
+    kids_months_paid = calculate_months_paid(parents_df , parent_kid_map , monthly_fee_per_kid )
 
-print("Print parents to their kids:")
-for parent, kids in parent_kid_map.items():
-    print(f"Parent: {parent} -> Kids: {', '.join(kids)}")
+    print("Kids months paid calculated:")
+    for kid, months in kids_months_paid.items():
+        print(f"Kid: {kid} -> Months Paid: {months}")
 
-kids_months_paid = calculate_months_paid(parents_df , parent_kid_map , monthly_fee_per_kid )
+    # Update the dataframe and assign it back
+    kids_df = update_kids_months_paid_pd(kids_months_paid, kids_df)
 
-print("Kids months paid calculated:")
-for kid, months in kids_months_paid.items():
-    print(f"Kid: {kid} -> Months Paid: {months}")
+    print("\nUpdated kids dataframe:")
+    print(kids_df.head())
 
-# Update the dataframe and assign it back
-kids_df = update_kids_months_paid_pd(kids_months_paid, kids_df)
+    # Save the updated dataframe back to Excel if needed
+    # kids_df.to_excel("updated_kids_list.xlsx", index=False)
 
-print("\nUpdated kids dataframe:")
-print(kids_df.head())
 
-# Save the updated dataframe back to Excel if needed
-# kids_df.to_excel("updated_kids_list.xlsx", index=False)
+    # Save the updated dataframe first
+    output_file = "updated_kids_list.xlsx"
+    kids_df.to_excel(output_file, index=False)
 
+    # Now apply styling with openpyxl
+    wb = openpyxl.load_workbook(output_file)
+    ws = wb.active
 
-# Save the updated dataframe first
-output_file = "updated_kids_list.xlsx"
-kids_df.to_excel(output_file, index=False)
+    # Define green fill (you can also use Font color if preferred)
+    from openpyxl.styles import PatternFill
+    green_fill = PatternFill(start_color="C6EFCE", end_color="C6EFCE", fill_type="solid")  # Light green (like Excel's "Good" style)
 
-# Now apply styling with openpyxl
-wb = openpyxl.load_workbook(output_file)
-ws = wb.active
+    # Get the header row to find column indices for month columns
+    headers = [cell.value for cell in ws[1]]  # First row
 
-# Define green fill (you can also use Font color if preferred)
-from openpyxl.styles import PatternFill
-green_fill = PatternFill(start_color="C6EFCE", end_color="C6EFCE", fill_type="solid")  # Light green (like Excel's "Good" style)
+    # Find column indices (1-based) for each month column
+    month_col_indices = []
+    for col_idx, header in enumerate(headers, start=1):
+        if header in month_columns:
+            month_col_indices.append(col_idx)
 
-# Get the header row to find column indices for month columns
-headers = [cell.value for cell in ws[1]]  # First row
+    # Iterate through rows (skip header)
+    for row in ws.iter_rows(min_row=2, max_row=ws.max_row):
+        for col_idx in month_col_indices:
+            cell = row[col_idx - 1]  # row is 0-based tuple
+            if cell.value == "Paid":
+                cell.fill = green_fill
+                # Optional: make text bold or change font color
+                # cell.font = Font(color="006100")  # Dark green text
 
-# Find column indices (1-based) for each month column
-month_col_indices = []
-for col_idx, header in enumerate(headers, start=1):
-    if header in month_columns:
-        month_col_indices.append(col_idx)
+    # Save the styled workbook
+    wb.save(output_file)
+    print(f"\n✅ Excel file saved with green 'Paid' cells: {output_file}")
 
-# Iterate through rows (skip header)
-for row in ws.iter_rows(min_row=2, max_row=ws.max_row):
-    for col_idx in month_col_indices:
-        cell = row[col_idx - 1]  # row is 0-based tuple
-        if cell.value == "Paid":
-            cell.fill = green_fill
-            # Optional: make text bold or change font color
-            # cell.font = Font(color="006100")  # Dark green text
 
-# Save the styled workbook
-wb.save(output_file)
-print(f"\n✅ Excel file saved with green 'Paid' cells: {output_file}")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -11,6 +11,8 @@ from PyQt6.QtWidgets import (
 from PyQt6.QtCore import Qt, QThread, pyqtSignal
 from PyQt6.QtGui import QFont
 
+from RealProject.amount_parser import parse_amounts
+
 
 class Worker(QThread):
     log_signal = pyqtSignal(str)
@@ -42,16 +44,13 @@ class Worker(QThread):
                         parent_kid_map[parent] = matched_kids
                 return parent_kid_map
 
-            def get_amount_from_string(amount_str):
-                try:
-                    return int(''.join(filter(str.isdigit, str(amount_str))))
-                except:
-                    return 0
-
             def calculate_months_paid(parents_df, parent_kid_map, monthly_fee):
+                amounts, invalid = parse_amounts(parents_df['amount'])
+                if invalid.any():
+                    self.log_signal.emit(f"⚠️ {int(invalid.sum())} amount(s) could not be read and count as 0.")
                 parents_amount = dict(zip(
                     parents_df['parents_name'],
-                    parents_df['amount'].apply(get_amount_from_string)
+                    amounts.fillna(0)
                 ))
                 kids_months_paid = {}
                 for parent, kids in parent_kid_map.items():